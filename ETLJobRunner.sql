@@ -40,11 +40,17 @@ CREATE TABLE Metadata(
 	IsPK BIT DEFAULT 0,
 	IsFK BIT DEFAULT 0,
 	IsNullable BIT DEFAULT 1 ,
-	ReferenceTable VARCHAR(100) NULL
+	ReferenceTable VARCHAR(100) NULL,
+	IsWatermark BIT DEFAULT 0 -- incremental loads read rows newer than the tracker by this column
 	);
 
+-- Covers the per-job metadata lookup in create_target_tables
+CREATE INDEX IX_Metadata_JobName ON Metadata (JobName)
+INCLUDE (TargetColumnName, TargetDataType, [Length], IsPK, IsFK, IsNullable, ReferenceTable);
+
 -- Audit/log Table
 CREATE TABLE JobAudit(
+	Id INT IDENTITY(1,1) PRIMARY KEY,
 	JobName VARCHAR(100) NOT NULL,
 	Stage VARCHAR(50) NULL, -- RAW,CURATED,PROCESSED
 	StartTime DATETIME DEFAULT GETDATE(),
@@ -53,6 +59,9 @@ CREATE TABLE JobAudit(
 	[Status] VARCHAR(20) , --Success,Failed
 	[Message] NVARCHAR(MAX) NULL
 );
+
+-- Lookup of the open audit row for a job+stage
+CREATE INDEX IX_JobAudit_JobName_Stage_EndTime ON JobAudit (JobName, Stage, EndTime);
 --Incremental 
 CREATE TABLE IncrementalTracker(
 	JobName VARCHAR(100) NOT NULL,
@@ -157,3 +166,22 @@ TRUNCATE TABLE IncrementalTracker;
 ALTER TABLE Metadata
 ADD CONSTRAINT UQ_Metadata UNIQUE (JobName, TargetColumnName);
 
+--Migrate existing JobAudit (audit rows are updated by Id); no-ops on a fresh database
+IF COL_LENGTH('JobAudit', 'Id') IS NULL
+	ALTER TABLE JobAudit
+	ADD Id INT IDENTITY(1,1) PRIMARY KEY;
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes
+               WHERE name = 'IX_JobAudit_JobName_Stage_EndTime' AND object_id = OBJECT_ID('JobAudit'))
+	CREATE INDEX IX_JobAudit_JobName_Stage_EndTime ON JobAudit (JobName, Stage, EndTime);
+
+--Migrate existing Metadata (per-job lookup index); no-op on a fresh database
+IF NOT EXISTS (SELECT 1 FROM sys.indexes
+               WHERE name = 'IX_Metadata_JobName' AND object_id = OBJECT_ID('Metadata'))
+	CREATE INDEX IX_Metadata_JobName ON Metadata (JobName)
+	INCLUDE (TargetColumnName, TargetDataType, [Length], IsPK, IsFK, IsNullable, ReferenceTable);
+
+--Migrate existing Metadata (incremental watermark column flag); no-op on a fresh database
+IF COL_LENGTH('Metadata', 'IsWatermark') IS NULL
+	ALTER TABLE Metadata
+	ADD IsWatermark BIT DEFAULT 0;
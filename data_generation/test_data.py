@@ -1,12 +1,11 @@
 import os
-import pandas as pd
+import csv
 import numpy as np
 from faker import Faker
 import os, json, random, string
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from datetime import datetime, timedelta
-fake = Faker()
-
-np.random.seed(42)
 
  
 
@@ -20,59 +19,93 @@ num_days = 12
 
 def rand_str(n=6): return ''.join(random.choices(string.ascii_letters, k=n))
 
-def inject_invalid(df, col, frac, val):
-    n = int(len(df)*frac)
-    if n>0:
-        idx = np.random.choice(df.index, n, replace=False)
-        df.loc[idx,col] = val
-    return df
-
-for day in range(num_days):
+# Tables are NumPy structured arrays; a missing string is written as an empty field
+def inject_invalid(arr, col, frac, val, rng):
+    mask = rng.random(len(arr)) < frac
+    arr[col][mask] = val
+    return arr
+
+def inject_invalid_disjoint(arr, rules, rng):
+    """Apply several (col, frac, val) rules from a single uniform draw.
+    Each rule owns a disjoint slice of [0, 1), so a row is invalidated in at most one column."""
+    u = rng.random(len(arr))
+    lower = 0.0
+    for col, frac, val in rules:
+        arr[col][(u >= lower) & (u < lower+frac)] = val
+        lower += frac
+    return arr
+
+def write_csv(path, arr):
+    """Write a structured array as CSV with its field names as the header row."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(arr.dtype.names)
+        writer.writerows(arr.tolist())
+
+def generate_day(day, word_pool, company_pool):
+    """Write the Products, Stores and Transactions files for one day."""
+    # Seeded per day so output does not depend on which worker runs it
+    rng = np.random.default_rng(42+day)
     date_str = (start_date+timedelta(days=day)).strftime("%Y_%m_%d")
+    iso_date = (start_date+timedelta(days=day)).strftime("%Y-%m-%d")
 
     # Products
-    products = pd.DataFrame({
-        "product_id": range(1000,1200),
-        "product_name": [fake.word().capitalize() for _ in range(200)],
-        "unit_price": np.random.randint(50,2000,200),
-        "effective_date": (start_date+timedelta(days=day)).strftime("%Y-%m-%d")
-    })
-    products = inject_invalid(products,"unit_price",0.05,-100)
-    products = inject_invalid(products,"product_name",0.05,None)
-    products.to_csv(f"{product_dir}/products_{date_str}.csv",index=False)
+    products = np.empty(200, dtype=[("product_id","i4"),("product_name",word_pool.dtype),
+                                    ("unit_price","i4"),("effective_date","U10")])
+    products["product_id"] = np.arange(1000,1200)
+    products["product_name"] = rng.choice(word_pool,200)
+    products["unit_price"] = rng.integers(50,2000,200)
+    products["effective_date"] = iso_date
+    products = inject_invalid(products,"unit_price",0.05,-100,rng)
+    products = inject_invalid(products,"product_name",0.05,"",rng)
+    write_csv(f"{product_dir}/products_{date_str}.csv", products)
 
     # Stores
-    stores = pd.DataFrame({
-        "store_id": range(2000,2080),
-        "store_name": [fake.company() for _ in range(80)],
-        "capacity": np.random.randint(100,1000,80)
-    })
-    stores = inject_invalid(stores,"store_name",0.05,None)
-    stores = inject_invalid(stores,"capacity",0.05,-1)
-    stores.to_csv(f"{store_dir}/stores_{date_str}.csv",index=False)
-
-    # Transactions
-    txns = pd.DataFrame({
-        "txn_num": range(300000+day*1000,300000+(day+1)*1000),
-        "product_id": np.random.choice(products["product_id"],1000),
-        "store_id": np.random.choice(stores["store_id"],1000),
-        "qty": np.random.randint(1,10,1000),
-        "unit_price": np.random.randint(50,2000,1000),
-        "txn_date": (start_date+timedelta(days=day)).strftime("%Y-%m-%d")
-    })
+    stores = np.empty(80, dtype=[("store_id","i4"),("store_name",company_pool.dtype),("capacity","i4")])
+    stores["store_id"] = np.arange(2000,2080)
+    stores["store_name"] = rng.choice(company_pool,80)
+    stores["capacity"] = rng.integers(100,1000,80)
+    stores = inject_invalid(stores,"store_name",0.05,"",rng)
+    stores = inject_invalid(stores,"capacity",0.05,-1,rng)
+    write_csv(f"{store_dir}/stores_{date_str}.csv", stores)
+
+    # Transactions (amount computed on the raw arrays)
+    txns = np.empty(1000, dtype=[("txn_num","i4"),("product_id","i4"),("store_id","i4"),("qty","i4"),
+                                 ("unit_price","i4"),("txn_date","U10"),("final_amount","i4")])
+    txns["txn_num"] = np.arange(300000+day*1000,300000+(day+1)*1000)
+    txns["product_id"] = rng.choice(products["product_id"],1000)
+    txns["store_id"] = rng.choice(stores["store_id"],1000)
+    txns["qty"] = rng.integers(1,10,1000)
+    txns["unit_price"] = rng.integers(50,2000,1000)
+    txns["txn_date"] = iso_date
     txns["final_amount"] = txns["qty"]*txns["unit_price"]
-    txns = inject_invalid(txns,"product_id",0.01,999999)
-    txns = inject_invalid(txns,"store_id",0.01,888888)
-    txns = inject_invalid(txns,"qty",0.05,-5)
-    txns = inject_invalid(txns,"final_amount",0.05,-1)
-    txns.to_csv(f"{txn_dir}/transactions_{date_str}.csv",index=False)
+    txns = inject_invalid_disjoint(txns,[
+        ("product_id",0.01,999999),
+        ("store_id",0.01,888888),
+        ("qty",0.05,-5),
+        ("final_amount",0.05,-1),
+    ],rng)
+    write_csv(f"{txn_dir}/transactions_{date_str}.csv", txns)
+
+
+if __name__ == "__main__":
+    # Pre-generated name pools, sampled per day instead of calling Faker per row.
+    # Built once here so the workers never touch Faker themselves.
+    fake = Faker()
+    word_pool = np.array([fake.word().capitalize() for _ in range(2000)])
+    company_pool = np.array([fake.company() for _ in range(800)])
+
+    worker = partial(generate_day, word_pool=word_pool, company_pool=company_pool)
+    with ProcessPoolExecutor() as ex:
+        list(ex.map(worker, range(num_days)))
 
-print("✅ Generated 12 days of Products, Stores, Transactions with invalids for cleaning tests.")
+    print("✅ Generated 12 days of Products, Stores, Transactions with invalids for cleaning tests.")
 
 
 # -------------------Logistic data --------------------------------
 
 # import os, json, random, string
+# import orjson
 # from datetime import datetime, timedelta
 
 # # --- Parameters ---
@@ -127,20 +160,20 @@ print("✅ Generated 12 days of Products, Stores, Transactions with invalids for
 
 #     # Suppliers (SCD1 incremental)
 #     suppliers = [gen_supplier(sid) for sid in range(1000, 1015)]
-#     with open(f"{supplier_dir}/suppliers_{date_str}.json","w") as f:
-#         json.dump(suppliers,f,indent=2)
+#     with open(f"{supplier_dir}/suppliers_{date_str}.json","wb") as f:
+#         f.write(orjson.dumps(suppliers, option=orjson.OPT_INDENT_2))
 
 #     # Warehouses (full load each day)
 #     warehouses = [gen_warehouse(wid) for wid in range(200,210)]
-#     with open(f"{warehouse_dir}/warehouses_{date_str}.json","w") as f:
-#         json.dump(warehouses,f,indent=2)
+#     with open(f"{warehouse_dir}/warehouses_{date_str}.json","wb") as f:
+#         f.write(orjson.dumps(warehouses, option=orjson.OPT_INDENT_2))
 
 #     # Shipments (incremental append)
 #     supplier_ids = [s["supplier_id"] for s in suppliers if s["supplier_id"]]
 #     warehouse_ids = [w["warehouse_id"] for w in warehouses if w["warehouse_id"]]
 #     shipments = [gen_shipment(3000+d*100+i, supplier_ids, warehouse_ids, d) for i in range(100)]
-#     with open(f"{shipment_dir}/shipments_{date_str}.json","w") as f:
-#         json.dump(shipments,f,indent=2)
+#     with open(f"{shipment_dir}/shipments_{date_str}.json","wb") as f:
+#         f.write(orjson.dumps(shipments, option=orjson.OPT_INDENT_2))
 
 # print(f"✅ Generated {num_days*3} JSON files under {base_dir}")
 
@@ -1,32 +1,42 @@
 
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
-from datetime import datetime
 from typing import Optional
 
 
-def log_job_start(engine: Engine, job_name: str, stage: str) -> None:
-    """Insert a new audit row when a stage starts."""
+def log_job_start(engine: Engine, job_name: str, stage: str) -> Optional[int]:
+    """Insert a new audit row when a stage starts. Returns the new row's Id."""
     with engine.begin() as conn:
-        conn.execute(text("""
+        return conn.execute(text("""
             INSERT INTO JobAudit (JobName, Stage, StartTime, Status)
-            VALUES (:job, :stage, :start, 'Running')
-        """), {"job": job_name, "stage": stage, "start": datetime.now()})
+            OUTPUT INSERTED.Id
+            VALUES (:job, :stage, GETDATE(), 'Running')
+        """), {"job": job_name, "stage": stage}).scalar()
 
 
 def log_job_end(engine: Engine, job_name: str, stage: str,
-                row_count: Optional[int], status: str, message: Optional[str] = None) -> None:
-    """Update the audit row when a stage ends."""
+                row_count: Optional[int], status: str, message: Optional[str] = None,
+                audit_id: Optional[int] = None) -> None:
+    """
+    Update the audit row when a stage ends. Timestamps come from the server clock.
+    Updates by primary key when audit_id (from log_job_start) is given,
+    otherwise falls back to the open row for job+stage.
+    """
+    params = {
+        "rows": row_count,
+        "status": status,
+        "msg": message,
+    }
+    if audit_id is not None:
+        where = "Id = :id"
+        params["id"] = audit_id
+    else:
+        where = "JobName = :job AND Stage = :stage AND EndTime IS NULL"
+        params.update({"job": job_name, "stage": stage})
+
     with engine.begin() as conn:
-        conn.execute(text("""
+        conn.execute(text(f"""
             UPDATE JobAudit
-            SET EndTime = :end, [RowCount] = :rows, [Status] = :status, [Message] = :msg
-            WHERE JobName = :job AND Stage = :stage AND EndTime IS NULL
-        """), {
-            "end": datetime.now(),
-            "rows": row_count,
-            "status": status,
-            "msg": message,
-            "job": job_name,
-            "stage": stage
-        })
+            SET EndTime = GETDATE(), [RowCount] = :rows, [Status] = :status, [Message] = :msg
+            WHERE {where}
+        """), params)
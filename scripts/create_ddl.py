@@ -1,9 +1,9 @@
-from typing import Dict, List, Any
-from sqlalchemy import text
+from typing import Dict, List, Any, Set, Tuple
+from sqlalchemy import text, bindparam, String
 from sqlalchemy.engine import Engine
 from datetime import datetime
 from collections import defaultdict
-from scripts.validate_input import _table_exists
+from scripts.validate_input import _table_exists, _existing_tables, _clear_table_cache
 from scripts.audit import log_job_start, log_job_end
 from scripts.send_log import send_log
 
@@ -15,31 +15,47 @@ ALLOWED_TYPES = VARLEN_TYPES | {
     "DATETIME", "DATE"
 }
 
-# --- Build column definition ---
-def _build_column_def(meta_row: Dict[str, Any],schema : str,scd_type:int) -> str:
+# --- Config + Metadata lookup, built once and reused by SQLAlchemy's compiled cache ---
+DDL_METADATA_SQL = text("""
+    SELECT c.TargetSchema, c.TargetTable,c.LoadType,c.SCDType,
+           m.TargetColumnName, m.TargetDataType, m.Length,
+           m.IsPK, m.IsFK, m.IsNullable, m.ReferenceTable
+    FROM Metadata m
+    JOIN Config c ON m.JobName = c.JobName
+    WHERE m.JobName = :job
+""").bindparams(bindparam("job", type_=String))
+
+# --- Resolve SQL type from metadata ---
+def _sql_type(meta_row: Dict[str, Any]) -> str:
     col = str(meta_row["TargetColumnName"])
     dtype = str(meta_row["TargetDataType"]).upper()
     length = int(meta_row.get("Length") or 0)
 
-    # If raw schema, just land as NVARCHAR(MAX)
-    if schema.lower() == "raw":
-        return f"[{col}] NVARCHAR(MAX) NULL"
-
     if dtype not in ALLOWED_TYPES:
         raise ValueError(f"Unsupported data type: {dtype}")
 
-    # Base type
     if dtype in VARLEN_TYPES:
         if length <= 0:
             raise ValueError(f"{dtype} requires positive Length for column '{col}'")
-        base = f"[{col}] {dtype}({length})"
-    else:
-        base = f"[{col}] {dtype}"
+        return f"{dtype}({length})"
 
     if dtype in {"DECIMAL", "NUMERIC"}:
         precision = int(meta_row.get("Precision") or 18)
         scale = int(meta_row.get("Scale") or 0)
-        base = f"[{col}] {dtype}({precision},{scale})"
+        return f"{dtype}({precision},{scale})"
+
+    return dtype
+
+# --- Build column definition ---
+def _build_column_def(meta_row: Dict[str, Any],schema : str,scd_type:int) -> str:
+    col = str(meta_row["TargetColumnName"])
+
+    # If raw schema, just land as NVARCHAR(MAX)
+    if schema.lower() == "raw":
+        return f"[{col}] NVARCHAR(MAX) NULL"
+
+    # Base type
+    base = f"[{col}] {_sql_type(meta_row)}"
 
 
     # PK handling
@@ -61,13 +77,19 @@ def _build_column_def(meta_row: Dict[str, Any],schema : str,scd_type:int) -> str
     return f"{base} {nullable}"
 
 # --- Foreign key clauses ---
-def _foreign_key_clauses(engine: Engine, metadata_rows: List[Dict[str, Any]]) -> List[str]:
+def _foreign_key_clauses(engine: Engine, metadata_rows: List[Dict[str, Any]],
+                         pending: Set[Tuple[str, str]] = frozenset()) -> List[str]:
     """
     Build foreign key clauses from metadata.
     - Deduplicates identical FKs
     - Ensures proper [schema].[table]([col]) syntax
     - Skips FK if referenced table does not exist
+    pending: lowercase (schema, table) pairs whose CREATE runs earlier in the same
+    batch, so they count as existing
     """
+    # One catalog lookup for all FK candidates
+    existing = _existing_tables(engine) | pending
+
     fk_clauses = []
     seen_fks = set()
 
@@ -89,7 +111,7 @@ def _foreign_key_clauses(engine: Engine, metadata_rows: List[Dict[str, Any]]) ->
             seen_fks.add(key)
 
             # Ensure referenced table exists before adding FK
-            if not _table_exists(engine, ref_schema, ref_table):
+            if (ref_schema.lower(), ref_table.lower()) not in existing:
                 # Optionally log a warning instead of failing
                 continue
 
@@ -134,32 +156,34 @@ def create_target_tables(engine: Engine, job_name: str) -> Dict[str, Any]:
     Config supplies schema/table, Metadata supplies column definitions.
     Deduplicates columns and constraints.
     """
+    audit_id = None
     try:        
-        log_job_start(engine, job_name, stage="ddl")
-        
+        audit_id = log_job_start(engine, job_name, stage="ddl")
+
+        # Fresh catalog: a stale hit would skip CREATE TABLE for a dropped table
+        _clear_table_cache()
+
         with engine.connect() as conn:
-            rows = conn.execute(text("""
-                SELECT c.TargetSchema, c.TargetTable,c.LoadType,c.SCDType,
-                       m.TargetColumnName, m.TargetDataType, m.Length,
-                       m.IsPK, m.IsFK, m.IsNullable, m.ReferenceTable
-                FROM Metadata m
-                JOIN Config c ON m.JobName = c.JobName
-                WHERE m.JobName = :job
-            """), {"job": job_name}).mappings().all()
+            rows = conn.execute(DDL_METADATA_SQL, {"job": job_name}).mappings().all()
 
         if not rows:
             msg = f"No metadata/config found for job '{job_name}'"
             log_job_end(engine, job_name, stage="ddl",
-                        row_count=0, status="failed", message=msg)
+                        row_count=0, status="failed", message=msg, audit_id=audit_id)
             return {"status": "error", "errors": [msg]}
         
-        # Group by schema+table
+        ddl_errors = []
+        ddl_statements = []
+        # Tables whose CREATE is already queued; DDL runs after this loop, so the
+        # catalog cannot see them yet when later tables build their FKs
+        pending_tables = set()
+
+        # Group by schema+table (Config has one row per JobName, so normally a single
+        # table); columns keep the order Metadata returned them in
         tables = defaultdict(list)
         for row in rows:
             tables[(row["TargetSchema"], row["TargetTable"])].append(row)
 
-        ddl_errors = []
-
         for (schema, table), columns in tables.items():
             col_defs, seen_cols = [], set()
             load_type=rows[0]["LoadType"]
@@ -202,42 +226,40 @@ def create_target_tables(engine: Engine, job_name: str) -> Dict[str, Any]:
                 col_defs.append("[IsCurrent] BIT NOT NULL DEFAULT (1)")
 
             
-            fk_clauses = _foreign_key_clauses(engine,columns)
-
-            ddl_parts = [f"CREATE TABLE [{schema}].[{table_name}] ("]
-            ddl_parts += [f"    {c}," for c in col_defs]
+            fk_clauses = _foreign_key_clauses(engine, columns, pending=pending_tables)
 
-            # Add FK constraints
-            ddl_parts += [f"    {fk}," for fk in fk_clauses]
+            # Column definitions followed by FK constraints
+            body = ",\n    ".join(col_defs + fk_clauses)
+            ddl_statements.append(f"CREATE TABLE [{schema}].[{table_name}] (\n    {body}\n);")
+            pending_tables.add((schema.lower(), table_name.lower()))
 
-            # Remove trailing comma
-            if ddl_parts[-1].endswith(","):
-                ddl_parts[-1] = ddl_parts[-1][:-1]
-
-            ddl_parts.append(");")
-            ddl_sql = "\n".join(ddl_parts)
-
-            # Execute
+        # Execute all CREATE TABLEs in one transaction; a savepoint per
+        # statement keeps one failing table from rolling back the others
+        if ddl_statements:
             with engine.begin() as conn:
-                try:
-                    conn.execute(text(ddl_sql))
-                except Exception as ddl_exc:
-                    ddl_errors.append(str(ddl_exc))
+                for ddl_sql in ddl_statements:
+                    try:
+                        with conn.begin_nested():
+                            conn.execute(text(ddl_sql))
+                    except Exception as ddl_exc:
+                        ddl_errors.append(str(ddl_exc))
+            # Refresh the cached catalog so the new tables are visible
+            _clear_table_cache()
 
         if ddl_errors:
             log_job_end(engine, job_name, stage="ddl",
-                        row_count=0, status="failed", message="; ".join(ddl_errors))
+                        row_count=0, status="failed", message="; ".join(ddl_errors), audit_id=audit_id)
             return {"status": "error", "errors": ddl_errors}
 
         # --- SUCCESSFUL END ---
         log_job_end(engine, job_name, stage="ddl",
-                    row_count=None, status="success", message="DDL completed")
+                    row_count=None, status="success", message="DDL completed", audit_id=audit_id)
         send_log("ddl", "DDL creation successful", status="success")
         
         return {"status": "success"}
 
     except Exception as exc:
         log_job_end(engine, job_name, stage="ddl",
-                    row_count=0, status="failed", message=str(exc))
+                    row_count=0, status="failed", message=str(exc), audit_id=audit_id)
         send_log("ddl", str(exc), status="failed", exception=exc)
         return {"status": "error", "errors": [str(exc)]}
@@ -11,34 +11,34 @@ ETL step: Curated → Processed
 import pandas as pd
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
-from typing import Dict, Any
+from typing import Dict, Any, List
 from datetime import datetime
 
 from scripts.audit import log_job_start, log_job_end
-from scripts.validate_input import _fetch_config, _fetch_metadata
+from scripts.validate_input import _fetch_config, _fetch_metadata, _table_exists
 from scripts.load_type import full_load,_update_incremental_tracker,incremental_load,_get_incremental_tracker
 from scripts.scd_type import scd1_merge, scd2_merge
 from scripts.create_ddl import create_target_tables  # metadata-driven DDL
 from scripts.send_log  import send_log
 
-# --- Case-insensitive schema/table existence check ---
-def _table_exists(engine: Engine, schema: str, table: str) -> bool:
-    with engine.connect() as conn:
-        result = conn.execute(
-            text("""
-                SELECT 1
-                FROM sys.tables t
-                JOIN sys.schemas s ON t.schema_id = s.schema_id
-                WHERE LOWER(s.name) = LOWER(:schema)
-                  AND LOWER(t.name) = LOWER(:table)
-            """),
-            {"schema": schema, "table": table}
-        ).scalar()
-    return result is not None
+# Rows fetched per round-trip when streaming the curated table
+READ_CHUNK_SIZE = 100_000
+
+# --- Map curated columns onto processed columns in metadata order ---
+def _align_columns(df: pd.DataFrame, metadata: List[Dict[str, Any]]) -> pd.DataFrame:
+    source_cols = [m["SourceColumnName"] for m in metadata]
+    target_cols = [m["TargetColumnName"] for m in metadata]
+    if all(col in df.columns for col in source_cols):
+        # Single positional take + relabel instead of rename followed by reindex
+        perm = [df.columns.get_loc(col) for col in source_cols]
+        return df.iloc[:, perm].set_axis(target_cols, axis=1)
+    # Some source columns missing: reindex fills them with NULLs
+    rename_map = dict(zip(source_cols, target_cols))
+    return df.rename(columns=rename_map).reindex(columns=target_cols)
 
 def load_curated_to_processed(engine: Engine, job_name: str) -> Dict[str, Any]:
     """Load data from Curated layer into Processed layer for the given job."""
-    log_job_start(engine, job_name, stage="curated_to_processed")
+    audit_id = log_job_start(engine, job_name, stage="curated_to_processed")
 
     try:
         # --- Fetch config + metadata ---
@@ -65,54 +65,88 @@ def load_curated_to_processed(engine: Engine, job_name: str) -> Dict[str, Any]:
             create_target_tables(engine, job_name)
             print(f"Created table {target_schema}.{target_table} from metadata")
 
-        # --- Read from curated table ---
-        with engine.connect() as conn:
-            df = pd.read_sql(text(f"SELECT * FROM [{source_schema}].[{source_table}]"), conn)
-        print(f"Read {len(df)} rows from {source_schema}.{source_table}")
+        if load_type not in ("full", "incremental"):
+            return {"status": "error", "message": f"Unsupported LoadType: {load_type}"}
+
+        key_cols = [m["TargetColumnName"] for m in metadata if m.get("IsPK") == 1]
+        if load_type == "full":
+            label = "Full load completed"
+        elif scd_type == 1:
+            label = "Incremental SCD1 merge completed"
+        elif scd_type == 2:
+            label = "Incremental SCD2 merge completed"
+        else:
+            label = "Incremental MERGE completed"
+
+        # --- Read curated table in chunks (fetchmany per chunk, Arrow-backed columns) ---
+        total_rows, chunk_count, result = 0, 0, None
+        # Every chunk (and, for full loads, the TRUNCATE; for incremental ones, the
+        # tracker) is applied in one transaction on load_conn, so a failure part-way
+        # leaves the processed table and tracker as they were
+        with engine.connect() as conn, engine.begin() as load_conn:
+            chunks = pd.read_sql(
+                text(f"SELECT * FROM [{source_schema}].[{source_table}]"),
+                conn,
+                chunksize=READ_CHUNK_SIZE,
+                dtype_backend="pyarrow",
+            )
+            for chunk in chunks:
+                # --- Rename + align ---
+                df = _align_columns(chunk, metadata)
+                if df.empty:
+                    continue
+                target_cols = df.columns.tolist()
 
-        # --- Rename + align ---
-        rename_map = {m["SourceColumnName"]: m["TargetColumnName"] for m in metadata}
-        df = df.rename(columns=rename_map)
-        target_cols = [m["TargetColumnName"] for m in metadata]
-        df = df.reindex(columns=target_cols)
+                # --- Load based on type ---
+                if load_type == "full":
+                    # Truncate only before the first chunk, append the rest
+                    result = full_load(engine, df, target_schema, target_table,
+                                       truncate=(chunk_count == 0), conn=load_conn)
+                elif scd_type == 1:
+                    scd1_merge(engine, target_schema, target_table, df, key_cols, target_cols,
+                               conn=load_conn)
+                    result = {"status": "success", "rows": len(df)}
+                elif scd_type == 2:
+                    scd2_merge(engine, target_schema, target_table, df, key_cols, target_cols,
+                               conn=load_conn)
+                    result = {"status": "success", "rows": len(df)}
+                else:
+                    result = incremental_load(
+                        engine, job_name, target_schema, target_table,
+                        metadata, df, stage="curated_processed", key_columns=key_cols,
+                        conn=load_conn, update_tracker=False
+                    )
+                if result.get("status") == "error":
+                    # Roll back every chunk applied so far with the transaction
+                    raise RuntimeError(result.get("message"))
 
-        if df.empty:
+                chunk_count += 1
+                total_rows += len(df)
+
+            # --- Update tracker with run timestamp, atomically with the load ---
+            if load_type == "incremental" and result is not None:
+                _update_incremental_tracker(engine, job_name, datetime.now(), stage="curated_processed",
+                                            conn=load_conn)
+        print(f"Read {total_rows} rows from {source_schema}.{source_table} in {chunk_count} chunk(s)")
+
+        if result is None:
             msg = "No rows to load into processed table."
             log_job_end(engine, job_name, stage="curated_to_processed",
-                        row_count=0, status="success", message=msg)
+                        row_count=0, status="success", message=msg, audit_id=audit_id)
             return {"status": "success", "rows": 0, "message": msg}
 
-        # --- Load based on type ---
-        if load_type == "full":
-            result = full_load(engine, df, target_schema, target_table)
-        elif load_type == "incremental":
-            key_cols = [m["TargetColumnName"] for m in metadata if m.get("IsPK") == 1]
-            if scd_type == 1:
-                scd1_merge(engine, target_schema, target_table, df, key_cols, target_cols)
-                result = {"status": "success", "rows": len(df), "message": "Incremental SCD1 merge completed"}
-            elif scd_type == 2:
-                scd2_merge(engine, target_schema, target_table, df, key_cols, target_cols)
-                result = {"status": "success", "rows": len(df), "message": "Incremental SCD2 merge completed"}
-            else:
-                result = incremental_load(
-                    engine, job_name, target_schema, target_table,
-                    metadata, df, stage="curated_processed", key_columns=key_cols
-                )
-
-            # --- Update tracker with run timestamp ---
-            _update_incremental_tracker(engine, job_name, datetime.now(), stage="curated_processed")
-        else:
-            return {"status": "error", "message": f"Unsupported LoadType: {load_type}"}
+        result = {"status": "success", "rows": total_rows,
+                  "message": f"{label}: {total_rows} rows"}
 
         # --- SUCCESS ---
         log_job_end(engine, job_name, stage="curated_to_processed",
                     row_count=result.get("rows", 0),
-                    status=result.get("status"), message=result.get("message"))
+                    status=result.get("status"), message=result.get("message"), audit_id=audit_id)
         send_log("curated_to_processed", "Curated to Processed completed successfully", status="success")
         return result
     
     except Exception as exc:
         log_job_end(engine, job_name, stage="curated_to_processed",
-                    row_count=0, status="failed", message=str(exc))
+                    row_count=0, status="failed", message=str(exc), audit_id=audit_id)
         send_log("curated_to_processed", str(exc), status="failed", exception=exc)
         return {"status":"error","rows":0,"message":str(exc)}
\ No newline at end of file
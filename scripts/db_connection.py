@@ -4,19 +4,34 @@ from sqlalchemy import create_engine, text
 SERVER_NAME = "2M1Z6D3\\SQLEXPRESS"
 DATABASE_NAME = "ETLJobRunner"
 DRIVER_NAME = "{ODBC Driver 17 for SQL Server}"
+PACKET_SIZE = 32767  # SQL Server maximum; fewer TDS packets per bulk payload
+APP_NAME = "ETLJobRunner"
+POOL_SIZE = 8
+MAX_OVERFLOW = 16
 
 
-def get_engine():
+def get_engine(server: str = SERVER_NAME, database: str = DATABASE_NAME):
     """Create and return a SQLAlchemy engine for SQL Server."""
     print("[INFO] Building connection string...")
     connection_string = (
         f"DRIVER={DRIVER_NAME};"
-        f"SERVER={SERVER_NAME};"
-        f"DATABASE={DATABASE_NAME};"
+        f"SERVER={server};"
+        f"DATABASE={database};"
         "Trusted_Connection=yes;"
+        f"Packet Size={PACKET_SIZE};"
+        "MARS_Connection=Yes;"
+        f"APP={APP_NAME};"
+    )
+    print(f"[DEBUG] Connection string built for server: {server}, database: {database}")
+    # fast_executemany uses ODBC array parameter binding for bulk inserts;
+    # pre-ping discards pooled connections the server has already dropped
+    return create_engine(
+        f"mssql+pyodbc:///?odbc_connect={connection_string}",
+        fast_executemany=True,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True,
     )
-    print(f"[DEBUG] Connection string built for server: {SERVER_NAME}, database: {DATABASE_NAME}")
-    return create_engine(f"mssql+pyodbc:///?odbc_connect={connection_string}")
 
 
 def test_connection(engine):
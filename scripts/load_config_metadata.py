@@ -1,7 +1,7 @@
 import pandas as pd
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 CONFIG_INSERT_SQL = """
 INSERT INTO Config (
@@ -17,38 +17,44 @@ VALUES (
 METADATA_INSERT_SQL = """
 INSERT INTO Metadata (
     JobName, SourceColumnName, TargetColumnName, TargetDataType,
-    [Length], IsPK, IsFK, IsNullable, ReferenceTable
+    [Length], IsPK, IsFK, IsNullable, ReferenceTable, IsWatermark
 )
 VALUES (
     :JobName, :SourceColumnName, :TargetColumnName, :TargetDataType,
-    :Length, :IsPK, :IsFK, :IsNullable, :ReferenceTable
+    :Length, :IsPK, :IsFK, :IsNullable, :ReferenceTable, :IsWatermark
 )
 """
 
+CONFIG_COLUMNS = [
+    "JobName", "SourceType", "SourcePath", "SourceSchema", "SourceTable",
+    "TargetSchema", "TargetTable", "LoadType", "SCDType"
+]
+
+METADATA_COLUMNS = [
+    "JobName", "SourceColumnName", "TargetColumnName", "TargetDataType",
+    "Length", "IsPK", "IsFK", "IsNullable", "ReferenceTable", "IsWatermark"
+]
+
+
+def _to_params(df: pd.DataFrame, columns: List[str]) -> List[Dict[str, Any]]:
+    """Project df onto the insert columns and convert NaN to None, one dict per row."""
+    df = df.reindex(columns=columns).astype(object)
+    df = df.where(pd.notnull(df), None)
+    return df.to_dict(orient="records")
+
 def load_config_df(engine: Engine, df: pd.DataFrame) -> Dict[str, Any]:
     """
     Append Config DataFrame into SQL Server.
     No filtering or deletion — just inserts rows as-is.
     """
     try:
-        df = df.copy()
-        df = df.where(pd.notnull(df), None)
+        params = _to_params(df, CONFIG_COLUMNS)
 
-        inserted = 0
+        # Single executemany call instead of one INSERT round-trip per row
         with engine.begin() as conn:
-            for _, row in df.iterrows():
-                conn.execute(text(CONFIG_INSERT_SQL), {
-                    "JobName": row.get("JobName"),
-                    "SourceType": row.get("SourceType"),
-                    "SourcePath": row.get("SourcePath"),
-                    "SourceSchema": row.get("SourceSchema"),
-                    "SourceTable": row.get("SourceTable"),
-                    "TargetSchema": row.get("TargetSchema"),
-                    "TargetTable": row.get("TargetTable"),
-                    "LoadType": row.get("LoadType"),
-                    "SCDType": row.get("SCDType")
-                })
-                inserted += 1
+            if params:
+                conn.execute(text(CONFIG_INSERT_SQL), params)
+        inserted = len(params)
 
         return {"status": "success", "inserted": inserted}
 
@@ -62,24 +68,13 @@ def load_metadata_df(engine: Engine, df: pd.DataFrame) -> Dict[str, Any]:
     No filtering or deletion — just inserts rows as-is.
     """
     try:
-        df = df.copy()
-        df = df.where(pd.notnull(df), None)
+        params = _to_params(df, METADATA_COLUMNS)
 
-        inserted = 0
+        # Single executemany call instead of one INSERT round-trip per row
         with engine.begin() as conn:
-            for _, row in df.iterrows():
-                conn.execute(text(METADATA_INSERT_SQL), {
-                    "JobName": row.get("JobName"),
-                    "SourceColumnName": row.get("SourceColumnName"),
-                    "TargetColumnName": row.get("TargetColumnName"),
-                    "TargetDataType": row.get("TargetDataType"),
-                    "Length": row.get("Length"),
-                    "IsPK": row.get("IsPK"),
-                    "IsFK": row.get("IsFK"),
-                    "IsNullable": row.get("IsNullable"),
-                    "ReferenceTable": row.get("ReferenceTable"),
-                })
-                inserted += 1
+            if params:
+                conn.execute(text(METADATA_INSERT_SQL), params)
+        inserted = len(params)
 
         return {"status": "success", "inserted": inserted}
 
@@ -1,9 +1,13 @@
-from sqlalchemy import text, inspect
+from sqlalchemy import text, inspect, bindparam, column, table as sa_table
 from sqlalchemy.engine import Engine
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+from functools import lru_cache
+from contextlib import nullcontext
 from datetime import datetime
 import pandas as pd
 
+from scripts.create_ddl import _sql_type
+
 # --- Incremental Tracker ---
 
 def _get_incremental_tracker(engine: Engine, job_name: str, stage: str):
@@ -19,39 +23,249 @@ def _get_incremental_tracker(engine: Engine, job_name: str, stage: str):
         ).first()
     return row[0] if row else None
 
+# --- Batched tracker lookup: every requested stage of a job in one query ---
+TRACKER_BULK_SQL = text("""
+    SELECT Stage, LastLoadTime
+    FROM dbo.IncrementalTracker
+    WHERE JobName = :job AND Stage IN :stages
+""").bindparams(bindparam("stages", expanding=True))
+
+def _tracker_bulk_get(engine: Engine, job_name: str, stages: List[str]) -> Dict[str, Any]:
+    """Get the last load time for several stages of a job. Stages without a record are absent."""
+    with engine.connect() as conn:
+        rows = conn.execute(TRACKER_BULK_SQL, {"job": job_name, "stages": list(stages)}).all()
+    return {stage: last for stage, last in rows}
+
+def _tracker_value(engine: Engine, job_name: str, stage: str,
+                   trackers: Optional[Dict[str, Any]] = None):
+    """Last load time from a pre-fetched _tracker_bulk_get dict, or a single lookup without one."""
+    if trackers is not None:
+        return trackers.get(stage)
+    return _get_incremental_tracker(engine, job_name, stage)
+
 # ----Update Incremental Tracker---
-def _update_incremental_tracker(engine: Engine, job_name: str, new_value, stage: str) -> None:
-    """Update the IncrementalTracker table with the latest load time for a job+stage."""
-    with engine.begin() as conn:
-        conn.execute(
-            text("""
-                MERGE dbo.IncrementalTracker AS t
-                USING (SELECT :job AS JobName, :stage AS Stage, :val AS LastLoadTime) AS s
-                ON t.JobName = s.JobName AND t.Stage = s.Stage
-                WHEN MATCHED THEN 
-                    UPDATE SET LastLoadTime = s.LastLoadTime
-                WHEN NOT MATCHED THEN 
-                    INSERT (JobName, Stage, LastLoadTime) 
-                    VALUES (s.JobName, s.Stage, s.LastLoadTime);
-            """),
-            {"job": job_name, "stage": stage, "val": new_value}
+def _update_incremental_tracker(engine: Engine, job_name: str, new_value, stage: str,
+                                conn=None) -> None:
+    """
+    Update the IncrementalTracker table with the latest load time for a job+stage.
+    Pass conn to write inside the caller's transaction instead of a new one.
+    """
+    if conn is None:
+        with engine.begin() as conn:
+            _update_incremental_tracker(engine, job_name, new_value, stage, conn=conn)
+        return
+
+    conn.execute(
+        text("""
+            MERGE dbo.IncrementalTracker AS t
+            USING (SELECT :job AS JobName, :stage AS Stage, :val AS LastLoadTime) AS s
+            ON t.JobName = s.JobName AND t.Stage = s.Stage
+            WHEN MATCHED THEN 
+                UPDATE SET LastLoadTime = s.LastLoadTime
+            WHEN NOT MATCHED THEN 
+                INSERT (JobName, Stage, LastLoadTime) 
+                VALUES (s.JobName, s.Stage, s.LastLoadTime);
+        """),
+        {"job": job_name, "stage": stage, "val": new_value}
+    )
+
+# --- Bulk insert helper ---
+
+# Rows per executemany batch (matches a BULK INSERT BATCHSIZE of 5000)
+INSERT_BATCH_SIZE = 5000
+
+@lru_cache(maxsize=256)
+def _insert_statement(schema: str, table: str, columns: Tuple[str, ...]):
+    """
+    INSERT for schema.table built from the column names alone. Unlike to_sql this
+    needs no has_table/reflection round-trip, and it stays valid when a staging
+    table is dropped and recreated with the same columns.
+    """
+    return sa_table(table, *[column(col) for col in columns], schema=schema).insert()
+
+def _bulk_insert(engine: Engine, df: pd.DataFrame, schema: str, table: str,
+                 conn=None) -> None:
+    """
+    Append df to schema.table in INSERT_BATCH_SIZE batches, in one transaction.
+    Pass conn to insert inside the caller's transaction instead of a new one.
+    The engine has fast_executemany enabled, so each batch is one
+    array-bound ODBC round-trip. Multi-row VALUES inserts are deliberately
+    not used: they are capped by SQL Server's 2100-parameter limit and
+    bypass fast_executemany.
+    """
+    if conn is None:
+        with engine.begin() as conn:
+            _bulk_insert(engine, df, schema, table, conn=conn)
+        return
+
+    stmt = _insert_statement(schema, table, tuple(df.columns))
+    for start in range(0, len(df), INSERT_BATCH_SIZE):
+        batch = df.iloc[start:start + INSERT_BATCH_SIZE]
+        # Plain Python values with None for NA/NaN/NaT, as pyodbc expects
+        records = batch.astype(object).where(batch.notna(), None).to_dict(orient="records")
+        conn.execute(stmt, records)
+
+# --- Staging table helper ---
+
+# Identity column added to staging tables that are consumed in row batches
+STAGE_ROW_ID = "StageRowID"
+
+def _staging_column_types(metadata: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Map each metadata column to its target SQL type; unsupported types stay NVARCHAR(MAX)."""
+    types = {}
+    for m in metadata:
+        try:
+            types[m["TargetColumnName"]] = _sql_type(m)
+        except ValueError:
+            types[m["TargetColumnName"]] = "NVARCHAR(MAX)"
+    return types
+
+def _create_staging_table(engine: Engine, schema: str, staging_table: str, columns: List[str],
+                          row_id: bool = False,
+                          column_types: Optional[Dict[str, str]] = None,
+                          conn=None) -> None:
+    """
+    (Re)create schema.staging_table with one nullable column per column name,
+    typed from column_types (see _staging_column_types) or NVARCHAR(MAX).
+    With row_id=True the table also gets a 1-based STAGE_ROW_ID identity column.
+    Pass conn to run inside the caller's transaction instead of a new one.
+    """
+    column_types = column_types or {}
+    with (engine.begin() if conn is None else nullcontext(conn)) as conn:
+        conn.execute(text(f"IF OBJECT_ID('{schema}.{staging_table}', 'U') IS NOT NULL DROP TABLE [{schema}].[{staging_table}]"))
+        col_defs = [f"[{col}] {column_types.get(col, 'NVARCHAR(MAX)')} NULL" for col in columns]
+        if row_id:
+            col_defs.insert(0, f"[{STAGE_ROW_ID}] INT IDENTITY(1,1) NOT NULL")
+        conn.execute(text(f"CREATE TABLE [{schema}].[{staging_table}] ({', '.join(col_defs)});"))
+
+def _stage_dataframe(engine: Engine, df: pd.DataFrame, schema: str, staging_table: str,
+                     row_id: bool = False,
+                     column_types: Optional[Dict[str, str]] = None,
+                     conn=None) -> None:
+    """
+    (Re)create schema.staging_table for df's columns and bulk insert df.
+    Pass conn to run inside the caller's transaction instead of new ones.
+    """
+    _create_staging_table(engine, schema, staging_table, df.columns.tolist(), row_id=row_id,
+                          column_types=column_types, conn=conn)
+
+    print(f"Staging {len(df)} rows into {schema}.{staging_table}")
+    if not df.empty:
+        _bulk_insert(engine, df, schema, staging_table, conn=conn)
+
+# --- Staging → target helpers ---
+
+def _index_staging(conn, schema: str, staging_table: str, key_columns: List[str]) -> None:
+    """Cluster a loaded staging table on key_columns so the join to the target is ordered."""
+    if key_columns:
+        keys = ", ".join([f"[{col}]" for col in key_columns])
+        conn.execute(text(f"CREATE CLUSTERED INDEX [IX_{staging_table}] ON [{schema}].[{staging_table}] ({keys});"))
+
+def _staging_insert_sql(schema: str, table: str, staging_table: str, columns: List[str]) -> str:
+    """INSERT ... SELECT copying columns from schema.staging_table into schema.table."""
+    insert_cols = ", ".join([f"[{col}]" for col in columns])
+    insert_vals = ", ".join([f"s.[{col}]" for col in columns])
+    return f"""
+    INSERT INTO [{schema}].[{table}] ({insert_cols})
+    SELECT {insert_vals} FROM [{schema}].[{staging_table}] AS s;
+    """
+
+def _dedupe_staging(conn, schema: str, staging_table: str, key_columns: List[str]) -> int:
+    """
+    Keep only the last staged row (highest STAGE_ROW_ID) per key in a row_id staging table.
+    Returns the number of rows removed.
+    """
+    partition = ", ".join([f"[{col}]" for col in key_columns])
+    result = conn.execute(text(f"""
+        WITH ranked AS (
+            SELECT ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY [{STAGE_ROW_ID}] DESC) AS rn
+            FROM [{schema}].[{staging_table}]
         )
+        DELETE FROM ranked WHERE rn > 1;
+    """))
+    return max(result.rowcount, 0)
+
+@lru_cache(maxsize=256)
+def _build_merge_sql(schema: str, table: str, staging_table: str,
+                     columns: Tuple[str, ...], key_columns: Tuple[str, ...]) -> Tuple[str, str, Optional[str], str]:
+    """
+    Build the staging → target statements once per (table, staging, columns, keys).
+    Returns (insert_sql, merge_sql, update_sql, delete_sql); update_sql is None when
+    every column is a key.
+    """
+    on_clause = " AND ".join([f"t.[{col}] = s.[{col}]" for col in key_columns])
+    update_clause = ", ".join([f"t.[{col}] = s.[{col}]" for col in columns if col not in key_columns])
+    insert_cols = ", ".join([f"[{col}]" for col in columns])
+    insert_vals = ", ".join([f"s.[{col}]" for col in columns])
+    insert_sql = _staging_insert_sql(schema, table, staging_table, list(columns))
+
+    merge_sql = f"""
+    MERGE [{schema}].[{table}] WITH (TABLOCK) AS t
+    USING [{schema}].[{staging_table}] AS s
+    ON {on_clause}
+    WHEN MATCHED THEN UPDATE SET {update_clause}
+    WHEN NOT MATCHED THEN INSERT ({insert_cols}) VALUES ({insert_vals});
+    """
+
+    update_sql = f"""
+    UPDATE t SET {update_clause}
+    FROM [{schema}].[{table}] AS t
+    JOIN [{schema}].[{staging_table}] AS s ON {on_clause};
+    """ if update_clause else None
+
+    delete_sql = f"""
+    DELETE s FROM [{schema}].[{staging_table}] AS s
+    WHERE EXISTS (SELECT 1 FROM [{schema}].[{table}] AS t WHERE {on_clause});
+    """
+    return insert_sql, merge_sql, update_sql, delete_sql
+
+def _merge_staging(conn, schema: str, table: str, staging_table: str, columns: List[str],
+                   key_columns: List[str], use_merge: bool = False) -> str:
+    """
+    Upsert schema.staging_table into schema.table on key_columns using conn's transaction.
+    - Empty target: INSERTs staging straight into it
+    - Otherwise UPDATEs matched target rows, drops them from staging, INSERTs the rest
+      (or a single MERGE when use_merge=True)
+    Returns the mode used ("insert", "MERGE" or "upsert").
+    """
+    insert_sql, merge_sql, update_sql, delete_sql = _build_merge_sql(
+        schema, table, staging_table, tuple(columns), tuple(key_columns)
+    )
+
+    # --- First load: nothing to match, insert staging directly ---
+    if conn.execute(text(f"SELECT TOP 1 1 FROM [{schema}].[{table}]")).first() is None:
+        conn.execute(text(insert_sql))
+        return "insert"
+
+    if use_merge:
+        conn.execute(text(merge_sql))
+        return "MERGE"
+
+    # --- UPDATE matched, remove them from staging, INSERT the remainder ---
+    if update_sql:
+        conn.execute(text(update_sql))
+    conn.execute(text(delete_sql))
+    conn.execute(text(insert_sql))
+    return "upsert"
 
 # --- Load Functions for Raw→Curated and Curated→Processed ---
 
-def full_load(engine: Engine, df: pd.DataFrame, schema: str, table: str) -> Dict[str, Any]:
+def full_load(engine: Engine, df: pd.DataFrame, schema: str, table: str,
+              truncate: bool = True, conn=None) -> Dict[str, Any]:
     """
-    Perform a full load: truncate target table, then insert all rows.
+    Perform a full load: truncate target table, then insert all rows, in one transaction.
+    Pass truncate=False to append further chunks of the same load, and conn to run
+    inside the caller's transaction so a chunked load commits or rolls back as a
+    whole (on an error result the caller must roll back).
     Tracker is NOT updated here (only used for incremental).
     """
     try:
-        with engine.begin() as conn:
-            conn.execute(text(f"TRUNCATE TABLE [{schema}].[{table}]"))
+        with (engine.begin() if conn is None else nullcontext(conn)) as conn:
+            if truncate:
+                conn.execute(text(f"TRUNCATE TABLE [{schema}].[{table}]"))
 
-        
-        if not df.empty:
-            df.to_sql(table, engine, schema=schema, if_exists="append", index=False,
-               chunksize=1000)
+            if not df.empty:
+                _bulk_insert(engine, df, schema, table, conn=conn)
         return {
             "status": "success",
             "rows": len(df),
@@ -63,12 +277,18 @@ def full_load(engine: Engine, df: pd.DataFrame, schema: str, table: str) -> Dict
 # --- Incremental Traker -----
 def incremental_load(engine: Engine, job_name: str, schema: str, table: str,
                      metadata: List[Dict[str, Any]], df: pd.DataFrame,
-                     stage: str, key_columns: List[str]) -> Dict[str, Any]:
+                     stage: str, key_columns: List[str],
+                     use_merge: bool = False, conn=None,
+                     update_tracker: bool = True) -> Dict[str, Any]:
     """
-    Perform an incremental load with MERGE (upsert) based only on PK columns.
-    - Creates a staging table
-    - MERGEs into target on key_columns
-    - Updates tracker with current timestamp
+    Perform an incremental upsert based only on PK columns.
+    - Creates a staging table typed from metadata, clustered on key_columns
+    - Empty target: INSERTs staging straight into it
+    - Otherwise UPDATEs matched target rows, drops them from staging, INSERTs the rest
+      (or a single MERGE on key_columns when use_merge=True)
+    - Updates tracker with current timestamp (unless update_tracker=False)
+    Pass conn to run inside the caller's transaction, e.g. to apply several chunks
+    atomically (on an error result the caller must roll back).
     """
     try:
         # --- Ensure only target columns are included ---
@@ -78,47 +298,23 @@ def incremental_load(engine: Engine, job_name: str, schema: str, table: str,
         if df.empty:
             return {"status": "success", "rows": 0, "message": "No rows to process."}
 
-        # --- Create staging table ---
+        # --- Create + bulk insert staging table ---
         staging_table = f"{table}_staging"
-        with engine.begin() as conn:
-            conn.execute(text(f"IF OBJECT_ID('{schema}.{staging_table}', 'U') IS NOT NULL DROP TABLE [{schema}].[{staging_table}]"))
-            col_defs = ", ".join([f"[{col}] NVARCHAR(MAX)" for col in target_cols])
-            conn.execute(text(f"CREATE TABLE [{schema}].[{staging_table}] ({col_defs});"))
-
-        # --- Bulk insert into staging ---
-        MAX_PARAMS = 32000
-        cols_per_row = len(df.columns)
-        safe_chunksize = MAX_PARAMS // cols_per_row
-        
-        print(f"Staging {len(df)} rows into {schema}.{staging_table}")
-        if not df.empty:
-            df.to_sql(staging_table, engine, schema=schema, if_exists="append", index=False,
-              chunksize=safe_chunksize)
-
-        # --- Build MERGE ---
-        on_clause = " AND ".join([f"t.[{col}] = s.[{col}]" for col in key_columns])
-        update_clause = ", ".join([f"t.[{col}] = s.[{col}]" for col in target_cols if col not in key_columns])
-        insert_cols = ", ".join([f"[{col}]" for col in target_cols])
-        insert_vals = ", ".join([f"s.[{col}]" for col in target_cols])
-
-        merge_sql = f"""
-        MERGE [{schema}].[{table}] AS t
-        USING [{schema}].[{staging_table}] AS s
-        ON {on_clause}
-        WHEN MATCHED THEN UPDATE SET {update_clause}
-        WHEN NOT MATCHED THEN INSERT ({insert_cols}) VALUES ({insert_vals});
-        """
-
-        with engine.begin() as conn:
-            conn.execute(text(merge_sql))
+        with (engine.begin() if conn is None else nullcontext(conn)) as conn:
+            _stage_dataframe(engine, df, schema, staging_table,
+                             column_types=_staging_column_types(metadata), conn=conn)
+            _index_staging(conn, schema, staging_table, key_columns)
+            mode = _merge_staging(conn, schema, table, staging_table, target_cols, key_columns,
+                                  use_merge=use_merge)
 
-        # --- Update tracker with current timestamp ---
-        _update_incremental_tracker(engine, job_name, datetime.now(), stage)
+            # --- Update tracker with current timestamp, atomically with the upsert ---
+            if update_tracker:
+                _update_incremental_tracker(engine, job_name, datetime.now(), stage, conn=conn)
 
         return {
             "status": "success",
             "rows": len(df),
-            "message": f"Incremental MERGE completed: {len(df)} rows processed"
+            "message": f"Incremental {mode} completed: {len(df)} rows processed"
         }
 
     except Exception as exc:
@@ -1,4 +1,4 @@
-from typing import Dict, Generator
+from typing import Any, Dict, Generator, Optional, Tuple
 from sqlalchemy.engine import Engine
 from sqlalchemy import text
 
@@ -6,7 +6,37 @@ from scripts.create_ddl import create_target_tables
 from scripts.source_raw import load_source_to_raw
 from scripts.raw_curated import load_raw_to_curated
 from scripts.curated_processed import load_curated_to_processed
-from scripts.audit import log_job_start, log_job_end
+from scripts.audit import log_job_end
+from scripts.load_type import _tracker_bulk_get
+from scripts.validate_input import _clear_table_cache
+
+# Incremental tracker stages read by the loaders, fetched once per run
+TRACKER_STAGES = ["source_raw", "raw_curated"]
+
+# Opens the "init" audit row and looks up the job config in one batch / round-trip.
+# NOCOUNT keeps the INSERT's row count from arriving ahead of the SELECT's result set.
+START_JOB_SQL = text("""
+    SET NOCOUNT ON;
+    DECLARE @audit TABLE (Id INT);
+    INSERT INTO JobAudit (JobName, Stage, StartTime, Status)
+    OUTPUT INSERTED.Id INTO @audit
+    VALUES (:job, 'init', GETDATE(), 'Running');
+    -- NOCOUNT is session-wide and outlives this batch on the pooled connection;
+    -- restore it before the SELECT so later DML still reports rowcount
+    SET NOCOUNT OFF;
+    SELECT (SELECT Id FROM @audit) AS AuditId,
+           c.JobName, c.SourceType, c.SourceSchema, c.SourceTable, c.TargetSchema
+    FROM (SELECT 1 AS one) AS x
+    LEFT JOIN Config c ON c.JobName = :job;
+""")
+
+
+def _start_job(engine: Engine, job_name: str) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+    """Returns (init audit Id, config row or None when the job has no Config)."""
+    with engine.begin() as conn:
+        row = conn.execute(START_JOB_SQL, {"job": job_name}).mappings().first()
+    config = dict(row) if row["JobName"] is not None else None
+    return row["AuditId"], config
 
 
 def run_job(engine: Engine, job_name: str) -> Generator[Dict, None, None]:
@@ -18,29 +48,22 @@ def run_job(engine: Engine, job_name: str) -> Generator[Dict, None, None]:
     def event(step: str, message: str, status: str = "running") -> Dict:
         return {"step": step, "message": message, "status": status}
 
-    # --- Start Audit ---
-    log_job_start(engine, job_name, stage="init")
-    yield event("init", f"Starting job '{job_name}'")
+    # Tables may have been created or dropped outside the app since the last run
+    _clear_table_cache()
 
-    # --- Look up job config ---
-    with engine.connect() as conn:
-        row = conn.execute(
-            text(
-                """
-                SELECT SourceType, SourceSchema, SourceTable, TargetSchema
-                FROM Config
-                WHERE JobName = :job
-                """
-            ),
-            {"job": job_name},
-        ).mappings().first()
+    # --- Start Audit + look up job config ---
+    init_audit_id, row = _start_job(engine, job_name)
+    yield event("init", f"Starting job '{job_name}'")
 
     if not row:
         yield event("init", f"No config found for job {job_name}", status="error")
         log_job_end(engine, job_name, stage="init", row_count=0,
-                    status="failed", message="No config found")
+                    status="failed", message="No config found", audit_id=init_audit_id)
         return
 
+    # --- Incremental trackers for every stage, one query, handed to the loaders ---
+    trackers = _tracker_bulk_get(engine, job_name, TRACKER_STAGES)
+
     source_type = row["SourceType"]
     source_schema = row["SourceSchema"]
     source_table = row["SourceTable"]
@@ -67,7 +90,7 @@ def run_job(engine: Engine, job_name: str) -> Generator[Dict, None, None]:
     if target_schema == "raw":
         # Source → Raw
         try:
-            result = load_source_to_raw(engine, job_name)
+            result = load_source_to_raw(engine, job_name, trackers=trackers)
             if result["status"] == "error":
                 yield event("source_to_raw", result["message"], status="error")
                 log_job_end(engine, job_name, stage="source_to_raw", row_count=0,
@@ -88,7 +111,7 @@ def run_job(engine: Engine, job_name: str) -> Generator[Dict, None, None]:
         try:
             if not source_schema or not source_table:
                 raise ValueError(f"Missing SourceSchema/SourceTable for job {job_name}")
-            result = load_raw_to_curated(engine, job_name)
+            result = load_raw_to_curated(engine, job_name, trackers=trackers)
             if result["status"] == "error":
                 yield event("raw_to_curated", result["message"], status="error")
                 log_job_end(engine, job_name, stage="raw_to_curated", row_count=0,
@@ -128,7 +151,7 @@ def run_job(engine: Engine, job_name: str) -> Generator[Dict, None, None]:
     else:
         yield event("init", f"Unknown target schema '{target_schema}' for job {job_name}", status="error")
         log_job_end(engine, job_name, stage="init", row_count=0,
-                    status="failed", message="Unknown target schema")
+                    status="failed", message="Unknown target schema", audit_id=init_audit_id)
         return
 
     # --- End Audit ---
@@ -6,91 +6,127 @@ ETL step: Raw → Curated
 - Applies generic data cleaning
 - Casts columns to target datatypes from metadata
 - Enforces PK/FK constraints (rejects bad rows)
-- Loads into curated tables (full or incremental with MERGE)
+- Streams chunks into a staging table, then loads curated tables (full or incremental) in one transaction
 """
 
 import pandas as pd
+import polars as pl
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 
 from scripts.audit import log_job_start, log_job_end
 from scripts.validate_input import _fetch_config, _fetch_metadata,_table_exists
-from scripts.load_type import full_load, incremental_load,_update_incremental_tracker
+from scripts.load_type import (
+    _bulk_insert, _create_staging_table, _staging_column_types, _index_staging,
+    _dedupe_staging, _merge_staging, _staging_insert_sql,
+    _tracker_value, _update_incremental_tracker,
+)
 from scripts.create_ddl import create_target_tables
 from scripts.send_log import send_log
 
+# Raw rows read, cleaned and staged per chunk
+READ_CHUNK_SIZE = 50_000
 
-# --- Generic Data Cleaning ---
-def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    """Basic cleaning: strip whitespace, normalize nulls, drop duplicates."""
-    for col in df.select_dtypes(include=["object"]).columns:
-        df[col] = df[col].astype(str).str.strip()
-        df[col] = df[col].replace({"": None, "nan": None, "None": None})
-    return df.drop_duplicates()
 
+# --- Metadata type groups ---
+INT_TYPES = ("INT", "BIGINT")
+FLOAT_TYPES = ("DECIMAL", "NUMERIC", "FLOAT", "REAL")
 
-# --- Type Casting based on Metadata ---
-def cast_dataframe_types(df: pd.DataFrame, metadata: List[Dict[str, Any]]) -> pd.DataFrame:
-    """Cast DataFrame columns to target datatypes defined in metadata."""
-    for m in metadata:
-        col = m["TargetColumnName"]
-        dtype = str(m["TargetDataType"]).upper()
-        if col not in df.columns:
-            continue
-        try:
-            if dtype in ("INT", "BIGINT"):
-                df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
-            elif dtype in ("DECIMAL", "NUMERIC", "FLOAT", "REAL"):
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-            elif dtype == "DATE":
-                df[col] = pd.to_datetime(df[col], errors="coerce").dt.date
-            elif dtype in ("DATETIME", "TIMESTAMP"):
-                df[col] = pd.to_datetime(df[col], errors="coerce")
-            elif dtype.startswith(("NVARCHAR", "VARCHAR", "TEXT")):
-                df[col] = df[col].astype(str).str.strip()
-        except Exception:
-            pass
-    return df
-
-
-def enforce_pk_fk(engine: Engine, df: pd.DataFrame, metadata: List[Dict[str, Any]]) -> pd.DataFrame:
+
+# --- Chunk transform for the raw → curated pipeline (Polars, lazy) ---
+def _polars_cast(col: str, dtype: str) -> Optional[pl.Expr]:
+    """Polars cast for one metadata type group; failed casts become null."""
+    c = pl.col(col)
+    if dtype in INT_TYPES:
+        # Exact string → Int64 (no precision loss past 2**53); only values that are
+        # not plain integers, e.g. "3.0", go through Float64 like pd.to_numeric
+        return pl.coalesce(c.cast(pl.Int64, strict=False),
+                           c.cast(pl.Float64, strict=False).cast(pl.Int64, strict=False))
+    if dtype in FLOAT_TYPES:
+        return c.cast(pl.Float64, strict=False)
+    if dtype == "DATE":
+        return c.cast(pl.String).str.to_datetime(strict=False).dt.date()
+    if dtype in ("DATETIME", "TIMESTAMP"):
+        return c.cast(pl.String).str.to_datetime(strict=False)
+    return None
+
+
+def transform_chunk(df: pd.DataFrame, metadata: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Generic cleaning + metadata type casts as one lazy Polars query:
+    strip/null-normalize text columns and cast to metadata types, collected
+    once on Polars' thread pool. Duplicates are removed later, on staging.
+    Returns Arrow-backed pandas columns for the staging insert.
+    """
+    lf = pl.from_pandas(df).lazy()
+    str_cols = [col for col, dtype in lf.collect_schema().items() if dtype == pl.String]
+    if str_cols:
+        lf = lf.with_columns(pl.col(str_cols).str.strip_chars().replace(["", "nan", "None"], None))
+
+    casts = [
+        expr for m in metadata
+        if m["TargetColumnName"] in df.columns
+        and (expr := _polars_cast(m["TargetColumnName"], str(m["TargetDataType"]).upper())) is not None
+    ]
+    if casts:
+        lf = lf.with_columns(casts)
+    return lf.collect().to_pandas(use_pyarrow_extension_array=True)
+
+
+def _print_constraint_audit(audit_log: List[Dict[str, Any]]) -> None:
+    if audit_log:
+        print("Constraint Audit Summary:")
+        for entry in audit_log:
+            print(entry)
+
+
+def enforce_staging_constraints(conn, schema: str, staging_table: str,
+                                metadata: List[Dict[str, Any]]) -> int:
     """
-    Enforce PK, NOT NULL, and FK constraints based on metadata.
-    Logs structured audit info for each rule.
+    Enforce the negative-value, PK, NOT NULL and FK rules in SQL against a
+    staging table created with row_id=True.
+    - Deletes rows with a NULL PK or NOT NULL column, or a negative numeric column
+    - Keeps the last staged row per PK; without a PK, drops whole-row duplicates
+    - Deletes rows whose FK value has no match in the reference table
+    Logs structured audit info for each rule and returns the number of rows removed.
     """
     audit_log = []
 
+    def _delete(rule: str, columns: List[str], predicate: str) -> None:
+        result = conn.execute(text(f"DELETE FROM [{schema}].[{staging_table}] WHERE {predicate}"))
+        if result.rowcount > 0:
+            audit_log.append({"rule": rule, "columns": columns, "dropped": result.rowcount})
+
+    # --- No negative numeric values ---
+    numeric_cols = [
+        m["TargetColumnName"] for m in metadata
+        if str(m["TargetDataType"]).upper() in INT_TYPES + FLOAT_TYPES
+    ]
+    if numeric_cols:
+        _delete("NO NEGATIVE", numeric_cols,
+                " OR ".join([f"TRY_CAST([{col}] AS FLOAT) < 0" for col in numeric_cols]))
+
     # --- Primary Key enforcement ---
     pk_cols = [m["TargetColumnName"] for m in metadata if m.get("IsPK") == 1]
     if pk_cols:
-        before = len(df)
-        df = df.dropna(subset=pk_cols)
-        df = df.drop_duplicates(subset=pk_cols, keep="last")
-        after = len(df)
-        if before != after:
-            audit_log.append({
-                "rule": "PK",
-                "columns": pk_cols,
-                "dropped": before - after
-            })
+        _delete("PK", pk_cols, " OR ".join([f"[{col}] IS NULL" for col in pk_cols]))
+        dropped = _dedupe_staging(conn, schema, staging_table, pk_cols)
+        if dropped:
+            audit_log.append({"rule": "PK", "columns": pk_cols, "duplicates": dropped})
+    else:
+        # Across the whole load, not per chunk
+        all_cols = [m["TargetColumnName"] for m in metadata]
+        dropped = _dedupe_staging(conn, schema, staging_table, all_cols)
+        if dropped:
+            audit_log.append({"rule": "DUPLICATE ROW", "columns": all_cols, "duplicates": dropped})
 
     # --- NOT NULL enforcement ---
-    not_null_cols = [m["TargetColumnName"] for m in metadata if m.get("IsNullable") == 0]
-    for col in not_null_cols:
-        if col in df.columns:
-            before = len(df)
-            df = df.dropna(subset=[col])
-            after = len(df)
-            if before != after:
-                audit_log.append({
-                    "rule": "NOT NULL",
-                    "columns": [col],
-                    "dropped": before - after
-                })
-
-    # --- Foreign Key enforcement ---
+    for col in [m["TargetColumnName"] for m in metadata if m.get("IsNullable") == 0]:
+        _delete("NOT NULL", [col], f"[{col}] IS NULL")
+
+    # --- Foreign Key enforcement: semi-join against the reference table ---
     fk_rules = [
         m for m in metadata
         if m.get("IsFK") == 1 and m.get("ReferenceTable") not in (None, "NULL", "")
@@ -99,71 +135,45 @@ def enforce_pk_fk(engine: Engine, df: pd.DataFrame, metadata: List[Dict[str, Any
         col = rule["TargetColumnName"]
         ref_table = rule["ReferenceTable"]
         ref_schema = rule.get("ReferenceSchema", "curated")
-
+        reference = f"{ref_schema}.{ref_table}"
         try:
-            with engine.connect() as conn:
-                ref_df = pd.read_sql(
-                    text(f"SELECT DISTINCT [{col}] FROM [{ref_schema}].[{ref_table}]"),
-                    conn
-                )
-            valid_values = set(ref_df[col].dropna().tolist())
-            before = len(df)
-            df = df[df[col].isin(valid_values)]
-            after = len(df)
-            if before != after:
-                audit_log.append({
-                    "rule": "FK",
-                    "columns": [col],
-                    "reference": f"{ref_schema}.{ref_table}",
-                    "dropped": before - after
-                })
+            # Savepoint so a missing reference table only skips this rule
+            with conn.begin_nested():
+                result = conn.execute(text(f"""
+                    DELETE s FROM [{schema}].[{staging_table}] AS s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM [{ref_schema}].[{ref_table}] AS r WHERE r.[{col}] = s.[{col}]
+                    )
+                """))
+            if result.rowcount > 0:
+                audit_log.append({"rule": "FK", "columns": [col], "reference": reference,
+                                  "dropped": result.rowcount})
         except Exception as e:
-            audit_log.append({
-                "rule": "FK",
-                "columns": [col],
-                "reference": f"{ref_schema}.{ref_table}",
-                "skipped": True,
-                "reason": str(e)
-            })
-            continue
-
-    # --- Print audit summary ---
-    if audit_log:
-        print("Constraint Audit Summary:")
-        for entry in audit_log:
-            print(entry)
-
-    return df
-
-
-def enforce_no_negative(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Enforce rule: no numeric column may contain values < 0.
-    Drops offending rows and logs how many were removed.
-    """
-    numeric_cols = df.select_dtypes(include=["number"]).columns
-    if not numeric_cols.empty:
-        before = len(df)
-        df = df[~(df[numeric_cols] < 0).any(axis=1)]
-        after = len(df)
-        if before != after:
-            print(f" Dropped {before - after} rows due to negative values in numeric columns {list(numeric_cols)}")
-    return df
+            audit_log.append({"rule": "FK", "columns": [col], "reference": reference,
+                              "skipped": True, "reason": str(e)})
 
+    _print_constraint_audit(audit_log)
+    return sum(entry.get("dropped", 0) + entry.get("duplicates", 0) for entry in audit_log)
 
 
 # --- Main Function: Raw → Curated ---
-def load_raw_to_curated(engine: Engine, job_name: str) -> Dict[str, Any]:
+def load_raw_to_curated(engine: Engine, job_name: str,
+                        trackers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     ETL step: Raw → Curated
-    - Reads data from raw tables
+    - Reads data from raw tables in READ_CHUNK_SIZE chunks
     - Renames columns based on metadata
     - Cleans and type-casts values
-    - Enforces PK/FK/NOT NULL constraints
-    - Loads into curated tables (full or incremental)
+    - Enforces PK/FK/NOT NULL/negative rules on staging in SQL
+    - Stages each chunk, then loads curated tables once (full or incremental)
+    - Incremental jobs with an IsWatermark column read only raw rows newer than the
+      raw_curated tracker, then advance it to the newest watermark over every row
+      applied, updated or inserted: a run that only updates existing keys still
+      moves the tracker, so the same rows are not re-read next run
+    trackers: optional pre-fetched _tracker_bulk_get result (see run_job)
     """
 
-    log_job_start(engine, job_name, stage="raw_to_curated")
+    audit_id = log_job_start(engine, job_name, stage="raw_to_curated")
 
     try:
         # --- Fetch Config & Metadata ---
@@ -186,71 +196,112 @@ def load_raw_to_curated(engine: Engine, job_name: str) -> Dict[str, Any]:
             create_target_tables(engine, job_name)
             print(f"Created curated table {target_schema}.{target_table} from metadata")
 
-        # --- Step 1: Read from raw table ---
-        with engine.connect() as conn:
-            df = pd.read_sql(text(f"SELECT * FROM [{source_schema}].[{source_table}]"), conn)
-        print(f" Read {len(df)} rows from {source_schema}.{source_table}")
-
-        # --- Step 2: Rename columns using metadata mapping ---
-        rename_map = {m["SourceColumnName"]: m["TargetColumnName"] for m in metadata}
-        df = df.rename(columns=rename_map)
+        if load_type not in ("full", "incremental"):
+            return {"status": "error", "message": f"Unsupported LoadType: {load_type}"}
 
         target_cols = [m["TargetColumnName"] for m in metadata]
-        df = df.reindex(columns=target_cols)
-        print(f" After rename/reindex: {len(df)} rows, cols={df.columns.tolist()}")
-
-        # --- Step 3: Clean + Cast ---
-        df = clean_dataframe(df)
-        df = cast_dataframe_types(df, metadata)
-        df = enforce_no_negative(df)
-
-        # --- Step 4: Enforce PK/FK/NOT NULL constraints ---
-        df = enforce_pk_fk(engine, df, metadata)
-        print(f" After PK/FK enforcement: {len(df)} rows")
+        key_cols = [m["TargetColumnName"] for m in metadata if m.get("IsPK") == 1]
+        rename_map = {m["SourceColumnName"]: m["TargetColumnName"] for m in metadata}
 
-        # --- Step 5: Handle empty DataFrame ---
-        if df.empty:
+        # --- Step 1: Build raw read ---
+        # Incremental jobs with an IsWatermark column only read rows newer than the tracker
+        watermark = None
+        if load_type == "incremental":
+            watermark = next((m for m in metadata if m.get("IsWatermark") == 1), None)
+        last_value = _tracker_value(engine, job_name, "raw_curated", trackers) if watermark else None
+
+        query = f"SELECT * FROM [{source_schema}].[{source_table}]"
+        params = {}
+        if last_value is not None:
+            # Raw columns are NVARCHAR, so convert before comparing
+            query += f" WHERE TRY_CONVERT(DATETIME2, [{watermark['SourceColumnName']}]) > :last"
+            params["last"] = last_value
+
+        # --- Step 2: Stream chunks → clean/cast (Polars) → staging ---
+        staging_table = f"{target_table}_staging"
+        _create_staging_table(engine, target_schema, staging_table, target_cols, row_id=True,
+                              column_types=_staging_column_types(metadata))
+
+        read_rows, staged_rows = 0, 0
+        with engine.connect() as conn:
+            # Arrow-backed columns: raw is all NVARCHAR, so chunks land as Arrow strings
+            # that transform_chunk hands to Polars without an object-dtype round trip.
+            # mssql+pyodbc has no server-side cursors; chunksize (fetchmany) bounds memory
+            chunks = pd.read_sql(text(query), conn,
+                                 params=params, chunksize=READ_CHUNK_SIZE,
+                                 dtype_backend="pyarrow")
+            for chunk in chunks:
+                read_rows += len(chunk)
+
+                # Rename columns using metadata mapping; the only column reorder in the pipeline
+                chunk = chunk.rename(columns=rename_map).reindex(columns=target_cols)
+
+                # Clean + cast in one Polars pass
+                chunk = transform_chunk(chunk, metadata)
+
+                if not chunk.empty:
+                    # reindex above fixed the column order; clean/cast only replace values
+                    assert chunk.columns.tolist() == target_cols
+                    _bulk_insert(engine, chunk, target_schema, staging_table)
+                    staged_rows += len(chunk)
+        print(f" Read {read_rows} rows from {source_schema}.{source_table}"
+              + (f" newer than {last_value}" if last_value is not None else "")
+              + f", staged {staged_rows}")
+
+        # --- Step 3: PK/duplicate/NOT NULL/FK/negative rules on staging ---
+        with engine.begin() as conn:
+            staged_rows -= enforce_staging_constraints(conn, target_schema, staging_table, metadata)
+
+        # --- Step 4: Handle empty load ---
+        if staged_rows == 0:
             msg = "No rows to load into curated table."
             log_job_end(engine, job_name, stage="raw_to_curated",
-                        row_count=0, status="success", message=msg)
+                        row_count=0, status="success", message=msg, audit_id=audit_id)
             return {"status": "success", "rows": 0, "message": msg}
 
-        # --- Step 6: Load into curated table ---
-        if load_type == "full":
-            # ✅ Ensure DataFrame columns match metadata exactly
-            target_cols = [m["TargetColumnName"] for m in metadata]
-            df = df[target_cols]  # ✅ Align columns
-            result = full_load(engine, df, target_schema, target_table)
-        elif load_type == "incremental":
-            key_cols = [m["TargetColumnName"] for m in metadata if m.get("IsPK") == 1]
-            # ✅ Ensure DataFrame columns match metadata exactly
-            target_cols = [m["TargetColumnName"] for m in metadata]
-            df = df[target_cols]  # ✅ Align columns
-            result = incremental_load(
-                engine,
-                job_name,
-                target_schema,
-                target_table,
-                metadata,
-                df,
-                stage="raw_curated",
-                key_columns=key_cols,
-            )
-            # Optional: update tracker with run timestamp
-            _update_incremental_tracker(engine, job_name, datetime.now(), stage="raw_curated")
-        else:
-            return {"status": "error", "message": f"Unsupported LoadType: {load_type}"}
-
-        # --- Step 7: Log success ---
+        # --- Step 5: Apply staging + advance tracker in one transaction ---
+        with engine.begin() as conn:
+            if load_type == "full":
+                conn.execute(text(f"TRUNCATE TABLE [{target_schema}].[{target_table}]"))
+                conn.execute(text(_staging_insert_sql(target_schema, target_table, staging_table, target_cols)))
+                mode = "Full load"
+            else:
+                # Newest watermark among the rows being applied (after the constraint
+                # rules). Read before _merge_staging, which deletes staged rows that
+                # updated an existing key, so updates count toward it too
+                high_water = None
+                if watermark is not None:
+                    high_water = conn.execute(text(
+                        f"SELECT MAX([{watermark['TargetColumnName']}]) FROM [{target_schema}].[{staging_table}]"
+                    )).scalar()
+
+                _index_staging(conn, target_schema, staging_table, key_cols)
+                mode = "Incremental " + _merge_staging(conn, target_schema, target_table, staging_table,
+                                                       target_cols, key_cols)
+
+                # Advance the tracker to that watermark, or the run timestamp without one
+                if watermark is None:
+                    _update_incremental_tracker(engine, job_name, datetime.now(), stage="raw_curated",
+                                                conn=conn)
+                elif high_water is not None:
+                    _update_incremental_tracker(engine, job_name, high_water,
+                                                stage="raw_curated", conn=conn)
+        result = {
+            "status": "success",
+            "rows": staged_rows,
+            "message": f"{mode} completed: {staged_rows} rows processed"
+        }
+
+        # --- Step 6: Log success ---
         log_job_end(engine, job_name, stage="raw_to_curated",
                     row_count=result.get("rows", 0),
-                    status=result.get("status"), message=result.get("message"))
+                    status=result.get("status"), message=result.get("message"), audit_id=audit_id)
         send_log("raw_curated", "Raw to Curated completed successfully", status="success")
         return result
 
     except Exception as exc:
-        # --- Step 8: Log failure ---
+        # --- Step 7: Log failure ---
         log_job_end(engine, job_name, stage="raw_to_curated",
-                    row_count=0, status="failed", message=str(exc))
+                    row_count=0, status="failed", message=str(exc), audit_id=audit_id)
         send_log("raw_curated", str(exc), status="failed", exception=exc)      
         return {"status": "error", "message": str(exc)}
@@ -19,37 +19,51 @@ from sqlalchemy import text
 from sqlalchemy.engine import Engine
 import pandas as pd
 from datetime import datetime
+from contextlib import nullcontext
+
+from scripts.load_type import _stage_dataframe, STAGE_ROW_ID
+
+# Staging rows applied per MERGE statement
+SCD_BATCH_SIZE = 5000
+
+
+def _staged_batch(schema: str, staging_table: str) -> str:
+    """Derived table over one STAGE_ROW_ID range (:lo, :hi] of a staging table."""
+    return (f"(SELECT * FROM [{schema}].[{staging_table}] "
+            f"WHERE [{STAGE_ROW_ID}] > :lo AND [{STAGE_ROW_ID}] <= :hi)")
 
 
 def scd1_merge(engine: Engine, schema: str, table: str,
-               df: pd.DataFrame, key_columns: list, target_cols: list) -> None:
+               df: pd.DataFrame, key_columns: list, target_cols: list,
+               batch_size: int = SCD_BATCH_SIZE, conn=None) -> None:
     """
     SCD1: Overwrite existing rows with new values, insert new rows if not found.
     No history columns are used.
+    Rows are bulk-loaded into a staging table and MERGEd from there,
+    batch_size rows per MERGE, all in one transaction (the caller's, when conn is passed).
     """
     on_clause = " AND ".join([f"t.[{col}] = s.[{col}]" for col in key_columns])
     update_clause = ", ".join([f"t.[{col}] = s.[{col}]" for col in target_cols if col not in key_columns])
     insert_cols = ", ".join([f"[{col}]" for col in target_cols])
     insert_vals = ", ".join([f"s.[{col}]" for col in target_cols])
 
-    # Build VALUES clause from DataFrame
-    values_clause = ",".join(
-        "(" + ",".join([f"'{row[col]}'" if pd.notna(row[col]) else "NULL" for col in target_cols]) + ")"
-        for _, row in df.iterrows()
-    )
-
+    # MERGE may touch each target row only once, so dedupe before staging
     df = df.drop_duplicates(subset=key_columns, keep="last")
-    
+
+    staging_table = f"{table}_scd_staging"
+
     merge_sql = f"""
     MERGE [{schema}].[{table}] AS t
-    USING (VALUES {values_clause}) AS s({",".join(target_cols)})
+    USING {_staged_batch(schema, staging_table)} AS s
     ON {on_clause}
     WHEN MATCHED THEN UPDATE SET {update_clause}
     WHEN NOT MATCHED THEN INSERT ({insert_cols}) VALUES ({insert_vals});
     """
 
-    with engine.begin() as conn:
-        conn.execute(text(merge_sql))
+    with (engine.begin() if conn is None else nullcontext(conn)) as conn:
+        _stage_dataframe(engine, df[target_cols], schema, staging_table, row_id=True, conn=conn)
+        for lo in range(0, len(df), batch_size):
+            conn.execute(text(merge_sql), {"lo": lo, "hi": lo + batch_size})
 
 
 # SCD 2 logic 
@@ -57,7 +71,8 @@ def scd2_merge(engine: Engine, schema: str, table: str,
                df: pd.DataFrame, key_columns: list, target_cols: list,
                start_col: str = "StartTime",
                end_col: str = "EndTime",
-               current_col: str = "IsCurrent") -> None:
+               current_col: str = "IsCurrent",
+               batch_size: int = SCD_BATCH_SIZE, conn=None) -> None:
     """
     Implements Slowly Changing Dimension Type 2 (SCD2) with rolling Start/End dates.
 
@@ -65,16 +80,12 @@ def scd2_merge(engine: Engine, schema: str, table: str,
     - Changed rows: old record closed (IsCurrent=0, EndTime=now),
                     new record inserted with StartTime=now, EndTime=NULL, IsCurrent=1
     - Unchanged rows: ignored
+    Both steps read from a staging table bulk-loaded once from df,
+    batch_size rows at a time, all in one transaction (the caller's, when conn is passed).
     """
 
-    # Build VALUES clause from DataFrame
-    values_clause = ",".join(
-        "(" + ",".join([f"'{row[col]}'" if pd.notna(row[col]) else "NULL"
-                        for col in target_cols]) + ")"
-        for _, row in df.iterrows()
-    )
-
-    source_cols = ",".join(target_cols)
+    staging_table = f"{table}_scd_staging"
+    source = _staged_batch(schema, staging_table)
 
     # Build change detection clause for non-key columns
     change_checks = " OR ".join([
@@ -90,7 +101,7 @@ def scd2_merge(engine: Engine, schema: str, table: str,
     SET t.{current_col} = 0,
         t.{end_col} = GETDATE()
     FROM [{schema}].[{table}] t
-    JOIN (VALUES {values_clause}) AS s({source_cols})
+    JOIN {source} AS s
       ON {" AND ".join([f"t.[{col}] = s.[{col}]" for col in key_columns])}
     WHERE t.{current_col} = 1
       AND ({change_checks});
@@ -101,7 +112,7 @@ def scd2_merge(engine: Engine, schema: str, table: str,
     INSERT INTO [{schema}].[{table}]
     ({",".join([f"[{c}]" for c in target_cols])}, [{start_col}], [{end_col}], [{current_col}])
     SELECT {",".join([f"s.[{c}]" for c in target_cols])}, GETDATE(), NULL, 1
-    FROM (VALUES {values_clause}) AS s({source_cols})
+    FROM {source} AS s
     LEFT JOIN [{schema}].[{table}] t
       ON {" AND ".join([f"t.[{col}] = s.[{col}]" for col in key_columns])}
      AND t.{current_col} = 1
@@ -109,7 +120,10 @@ def scd2_merge(engine: Engine, schema: str, table: str,
        OR ({change_checks});
     """
 
-    # Execute both steps in a transaction
-    with engine.begin() as conn:
-        conn.execute(text(update_sql))
-        conn.execute(text(insert_sql))
+    # Stage, then execute both steps per batch in a single transaction
+    with (engine.begin() if conn is None else nullcontext(conn)) as conn:
+        _stage_dataframe(engine, df[target_cols], schema, staging_table, row_id=True, conn=conn)
+        for lo in range(0, len(df), batch_size):
+            params = {"lo": lo, "hi": lo + batch_size}
+            conn.execute(text(update_sql), params)
+            conn.execute(text(insert_sql), params)
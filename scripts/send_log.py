@@ -1,9 +1,45 @@
 import uuid
 import datetime
+import logging
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson (C-implemented) serializes batches faster; stdlib json where it is missing
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:
+    import json
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+logger = logging.getLogger(__name__)
 
 ENDPOINT = "http://10.112.141.172:8001/logs"
 
+# One pooled keep-alive session for all log shipping, with short retries.
+# Only connect errors are retried: the batch never reached the endpoint, whereas
+# retrying a POST after a read error or 5xx could record its entries twice.
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, connect=2, read=0, status=0, other=0, backoff_factor=0.1),
+))
+
+# Fields identical on every entry; send_log only adds the per-call ones
+_BASE = {
+    "application": "ETL",
+    "app_id": "etl-aff72bb8",
+    "user_id": "6900934556bc8e47e7a464fd",
+}
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
 # Map ETL stages to severity levels for failures
 SEVERITY_MAP = {
     "source_raw": "ERROR",
@@ -13,13 +49,87 @@ SEVERITY_MAP = {
     "ddl": "ERROR"
 }
 
+# Local time with its current UTC offset, resolved per log so DST changes apply at once
+def _timestamp() -> str:
+    return datetime.datetime.now().astimezone().isoformat(timespec="seconds")
+
+# Full batches are POSTed off the caller's thread (ETL stages never wait on HTTP)
+_LOG_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="send_log")
+
+# Entries per POST, and the longest an entry waits before a partial batch is sent
+LOG_BATCH_SIZE = 50
+LOG_FLUSH_INTERVAL = 2.0
+
+class LogBatcher:
+    """
+    Accumulates log entries and POSTs them as one JSON array, when
+    LOG_BATCH_SIZE entries are pending or LOG_FLUSH_INTERVAL seconds after
+    the first pending entry, whichever comes first.
+    """
+
+    def __init__(self, batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries.append(entry)
+            if len(self._entries) >= self.batch_size:
+                batch = self._take()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_interval, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if batch:
+            _LOG_POOL.submit(self._post, batch)
+
+    def flush(self) -> None:
+        """Send everything pending now, on the calling thread."""
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._post(batch)
+
+    def _take(self) -> List[Dict[str, Any]]:
+        # Caller holds the lock
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._entries = self._entries, []
+        return batch
+
+    def _post(self, batch: List[Dict[str, Any]]) -> None:
+        stages = sorted({entry["path"] for entry in batch})
+        try:
+            resp = _SESSION.post(ENDPOINT, data=_dumps(batch), headers=_JSON_HEADERS, timeout=5)
+            resp.raise_for_status()
+            # Lazy %-formatting: the batch is only rendered when DEBUG is enabled
+            logger.debug("✅ Sent %d log entries for %s: %s", len(batch), stages, batch)
+        except Exception as e:
+            print(f"⚠️ Could not send {len(batch)} log entries for {stages}: {e}")
+            print("Log entries:", batch)
+
+
+_BATCHER = LogBatcher()
+# At exit (handlers run last-registered first): send what is pending, then
+# wait for in-flight batch POSTs to finish
+atexit.register(_LOG_POOL.shutdown, wait=True, cancel_futures=False)
+atexit.register(_BATCHER.flush)
+
+
 def send_log(stage: str,
              message: str,
              status: str = "success",   # "success" or "failed"
              exception: Exception = None,
              user_id: str = "system"):
     """
-    Send a structured log entry to the endpoint for both success and failure.
+    Queue a structured log entry for the endpoint for both success and failure
+    (sent in batches by LogBatcher, in the background; never blocks on HTTP).
     - On success: level=INFO, severity=INFO
     - On failure: level=ERROR, severity depends on stage
     """
@@ -31,25 +141,15 @@ def send_log(stage: str,
         level = "ERROR"
         severity = SEVERITY_MAP.get(stage, "ERROR")
 
-    log_entry = [{
+    _BATCHER.add({
+        **_BASE,
         # "log_id": str(uuid.uuid4()),
-        "application": "ETL",
-        "app_id": "etl-aff72bb8",
         "level": level,
         "severity": severity,
         "message": message,
-        "timestamp": datetime.datetime.now().astimezone().isoformat(timespec="seconds"),
+        "timestamp": _timestamp(),
         "path": stage,
         "exception_type": type(exception).__name__ if exception else None,
         "status_code": 200 if status == "success" else 500,
-        "user_id":"6900934556bc8e47e7a464fd",
         "tags": [stage, "etl", status]
-    }]
-
-    try:
-        resp = requests.post(ENDPOINT, json=log_entry, timeout=5)
-        resp.raise_for_status()
-        print(f"✅ Sent {status} log for {stage}: {log_entry}")
-    except Exception as e:
-        print(f"⚠️ Could not send log for {stage}: {e}")
-        print("Log entry:", log_entry)
+    })
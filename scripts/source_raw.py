@@ -1,81 +1,228 @@
 import os
-import glob
+import csv
+import tempfile
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from sqlalchemy.engine import Engine
 from sqlalchemy import text
-from typing import Dict, Any, List
+from sqlalchemy.exc import DBAPIError
+from typing import Dict, Any, Iterable, Iterator, List, Optional
 from datetime import datetime
 import re
 
 from scripts.audit import log_job_start, log_job_end
 from scripts.validate_input import _fetch_config, _fetch_metadata
-from scripts.load_type import _get_incremental_tracker, _update_incremental_tracker
+from scripts.load_type import _tracker_value, _update_incremental_tracker
 from scripts.send_log import send_log
 
 DATE_PATTERN = re.compile(r"(\d{4})_(\d{2})_(\d{2})")
 
-# --- Helpers ---
-def _read_source_files(files: List[str], source_type: str) -> pd.DataFrame:
-    dfs = []
-    for f in files:
-        if os.path.getsize(f) == 0:
-            print(f"⚠️ Skipping empty file: {f}")
-            continue
-        if source_type == "csv":
-            dfs.append(pd.read_csv(f, dtype=str))   # ✅ force all columns to string
-        elif source_type == "json":
-            try:
-                dfs.append(pd.read_json(f, dtype=str))
-            except ValueError as e:
-                raise ValueError(f"Invalid JSON in file {f}: {e}")
-    if not dfs:
-        raise ValueError("No valid dataframes to concatenate")
-    return pd.concat(dfs, ignore_index=True)
-
+# Rows per executemany call in _insert_raw
+RAW_INSERT_BATCH_SIZE = 10_000
 
-def _insert_raw(engine: Engine, df: pd.DataFrame, schema: str, table: str):
-    """Insert DataFrame into raw table using pyodbc executemany."""
-    if df.empty:
-        raise ValueError("No data to insert into raw table.")
+# Bytes of CSV parsed per streamed block (pyarrow parses each block multithreaded)
+READ_BLOCK_SIZE = 16 << 20
 
-    cols = df.columns.tolist()
-    col_clause = ', '.join(f"[{col}]" for col in cols)
-    placeholders = ', '.join(['?'] * len(cols))
-    query = f"INSERT INTO [{schema}].[{table}] ({col_clause}) VALUES ({placeholders})"
+# Opt-in BULK INSERT for full loads: a share both this process and the SQL Server
+# service account (with bulkadmin rights) can read, e.g. r"\\etlserver\bulk".
+# Unset (None), full loads insert directly with executemany.
+BULK_INSERT_DIR: Optional[str] = None
 
-    # ensure all values are strings before insert
-    data = df.astype(str).values.tolist()
+# --- Helpers ---
+def _csv_header(f: str) -> List[str]:
+    with open(f, newline="", encoding="utf-8-sig") as fh:
+        return next(csv.reader(fh), [])
+
+
+def _source_files(source_path: str, source_type: str) -> List[str]:
+    """
+    Non-empty source files: every *.csv / *.json in a directory (one scandir,
+    sizes from the DirEntry), or source_path itself when it is a file.
+    """
+    if not os.path.isdir(source_path):
+        if os.path.getsize(source_path) == 0:
+            print(f"⚠️ Skipping empty file: {source_path}")
+            return []
+        return [source_path]
+
+    suffix = f".{source_type}"
+    files = []
+    with os.scandir(source_path) as entries:
+        for entry in entries:
+            # same matches as glob("*.csv"): no dotfiles, case-insensitive as on Windows
+            if entry.name.startswith(".") or not entry.name.lower().endswith(suffix):
+                continue
+            if not entry.is_file():
+                continue
+            if entry.stat().st_size == 0:
+                print(f"⚠️ Skipping empty file: {entry.path}")
+                continue
+            files.append(entry.path)
+    return files
+
+
+def _iter_source_file(f: str, source_type: str) -> Iterator[pa.RecordBatch]:
+    """Stream one (non-empty) source file as all-string Arrow record batches."""
+    if source_type == "csv":
+        # ✅ force all columns to string; blanks/NA markers become nulls as with pandas
+        convert = pacsv.ConvertOptions(
+            column_types={col: pa.string() for col in _csv_header(f)},
+            strings_can_be_null=True,
+        )
+        reader = pacsv.open_csv(f, read_options=pacsv.ReadOptions(block_size=READ_BLOCK_SIZE),
+                                convert_options=convert)
+        yield from reader
+    elif source_type == "json":
+        # JSON sources are arrays of records, which pyarrow.json (NDJSON only) cannot parse
+        try:
+            df = pd.read_json(f, dtype=str)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON in file {f}: {e}")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.cast(pa.schema([(col, pa.string()) for col in table.column_names]))
+        yield from table.to_batches(max_chunksize=RAW_INSERT_BATCH_SIZE)
+
+
+def _iter_source_chunks(files: List[str], source_type: str) -> Iterator[pa.RecordBatch]:
+    """Yield every file's record batches, in file order."""
+    found = False
+    for f in files:
+        for batch in _iter_source_file(f, source_type):
+            found = True
+            yield batch
+    if not found:
+        raise ValueError("No valid dataframes to concatenate")
 
-    conn = engine.raw_connection()
-    cursor = conn.cursor()
 
+def _insert_raw(engine: Engine, chunks: Iterable[pa.RecordBatch], schema: str, table: str,
+                conn=None) -> int:
+    """
+    Insert Arrow record batches into raw table using pyodbc executemany, in one
+    transaction (rolled back if any chunk fails). Pass conn to insert inside the
+    caller's transaction instead of a new one.
+    fast_executemany sends each RAW_INSERT_BATCH_SIZE batch as one array-bound
+    round-trip. Returns the number of rows inserted.
+    """
+    if conn is None:
+        with engine.begin() as conn:
+            return _insert_raw(engine, chunks, schema, table, conn=conn)
+
+    # DBAPI cursor on the caller's connection, so it shares its transaction
+    cursor = conn.connection.cursor()
+    cursor.fast_executemany = True
+
+    rows = 0
     try:
-        cursor.executemany(query, data)
-        conn.commit()
+        for chunk in chunks:
+            if chunk.num_rows == 0:
+                continue
+            cols = chunk.schema.names
+            col_clause = ', '.join(f"[{col}]" for col in cols)
+            placeholders = ', '.join(['?'] * len(cols))
+            query = f"INSERT INTO [{schema}].[{table}] ({col_clause}) VALUES ({placeholders})"
+
+            # Arrow slices → row tuples; nulls arrive as None
+            for offset in range(0, chunk.num_rows, RAW_INSERT_BATCH_SIZE):
+                batch = chunk.slice(offset, RAW_INSERT_BATCH_SIZE)
+                cursor.executemany(query, list(zip(*(col.to_pylist() for col in batch.columns))))
+            rows += chunk.num_rows
+        if rows == 0:
+            raise ValueError("No data to insert into raw table.")
+    except ValueError:
+        raise
     except Exception as e:
-        conn.rollback()
         raise RuntimeError(f"Insert failed: {e}")
     finally:
         cursor.close()
-        conn.close()
+    return rows
+
+
+def _table_columns(conn, schema: str, table: str) -> List[str]:
+    return list(conn.execute(text(
+        "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
+        "WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table ORDER BY ORDINAL_POSITION"
+    ), {"schema": schema, "table": table}).scalars())
+
+
+def _bulk_insert_raw(engine: Engine, chunks: Iterable[pa.RecordBatch], schema: str, table: str,
+                     conn=None) -> int:
+    """
+    Full-load fast path when BULK_INSERT_DIR is configured: spool the chunks to
+    one CSV there and load it with a single BULK INSERT ... TABLOCK. BULK INSERT
+    maps fields by position, so it is only used when the chunk columns match the
+    table's column order; otherwise, or when the server cannot read the file,
+    the spooled CSV is streamed back through _insert_raw. Without
+    BULK_INSERT_DIR the chunks go straight to _insert_raw. Pass conn to load
+    inside the caller's transaction. Returns the number of rows inserted.
+    """
+    if conn is None:
+        with engine.begin() as conn:
+            return _bulk_insert_raw(engine, chunks, schema, table, conn=conn)
+    if not BULK_INSERT_DIR:
+        return _insert_raw(engine, chunks, schema, table, conn=conn)
+
+    fd, path = tempfile.mkstemp(prefix=f"{table}_", suffix=".csv", dir=BULK_INSERT_DIR)
+    os.close(fd)
+    try:
+        rows, cols, writer = 0, None, None
+        try:
+            for chunk in chunks:
+                if chunk.num_rows == 0:
+                    continue
+                if writer is None:
+                    cols = chunk.schema.names
+                    writer = pacsv.CSVWriter(path, chunk.schema)
+                writer.write_batch(chunk)
+                rows += chunk.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+        if rows == 0:
+            raise ValueError("No data to insert into raw table.")
+
+        if cols == _table_columns(conn, schema, table):
+            file_path = path.replace("'", "''")
+            try:
+                # savepoint: a failed BULK INSERT must not doom the caller's transaction
+                with conn.begin_nested():
+                    # pyarrow's CSVWriter ends rows with LF only, not BULK INSERT's default CRLF
+                    conn.exec_driver_sql(
+                        f"BULK INSERT [{schema}].[{table}] FROM '{file_path}' "
+                        "WITH (FORMAT = 'CSV', FIRSTROW = 2, CODEPAGE = '65001', "
+                        "ROWTERMINATOR = '0x0a', TABLOCK)"
+                    )
+                return rows
+            except DBAPIError as e:
+                # Some errors doom the whole transaction (XACT_STATE -1); then the
+                # caller's TRUNCATE must roll back rather than fall back
+                if conn.exec_driver_sql("SELECT XACT_STATE()").scalar() == -1:
+                    raise
+                print(f"⚠️ BULK INSERT failed, falling back to executemany: {e.orig}")
+
+        return _insert_raw(engine, _iter_source_chunks([path], "csv"), schema, table, conn=conn)
+    finally:
+        os.remove(path)
 
 
 # --- Main function ---
-def load_source_to_raw(engine: Engine, job_name: str) -> Dict[str, Any]:
-    log_job_start(engine, job_name, stage="source_to_raw")
+def load_source_to_raw(engine: Engine, job_name: str,
+                       trackers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    audit_id = log_job_start(engine, job_name, stage="source_to_raw")
 
     try:
         config_rows = _fetch_config(engine, job_name)
         if not config_rows:
             msg = f"No Config found for job '{job_name}'"
-            log_job_end(engine, job_name, stage="source_to_raw", row_count=0, status="failed", message=msg)
+            log_job_end(engine, job_name, stage="source_to_raw", row_count=0, status="failed", message=msg, audit_id=audit_id)
             return {"status": "error", "message": msg}
         config = config_rows[0]
 
         metadata = _fetch_metadata(engine, job_name)
         if not metadata:
             msg = f"No Metadata found for job '{job_name}'"
-            log_job_end(engine, job_name, stage="source_to_raw", row_count=0, status="failed", message=msg)
+            log_job_end(engine, job_name, stage="source_to_raw", row_count=0, status="failed", message=msg, audit_id=audit_id)
             return {"status": "error", "message": msg}
 
         target_schema = config["TargetSchema"]
@@ -85,75 +232,73 @@ def load_source_to_raw(engine: Engine, job_name: str) -> Dict[str, Any]:
         source_type = str(config["SourceType"]).lower()
 
         # --- Collect files ---
-        if os.path.isdir(source_path):
-            pattern = "*.csv" if source_type == "csv" else "*.json"
-            files = glob.glob(os.path.join(source_path, pattern))
-        else:
-            files = [source_path]
+        files = _source_files(source_path, source_type)
 
         if not files:
             raise FileNotFoundError(f"No {source_type.upper()} files found in {source_path}")
 
         # --- Load logic ---
-        def process_files(file_list: List[str]) -> pd.DataFrame:
-            df = _read_source_files(file_list, source_type)
-
-            # Ensure all expected source columns exist
+        def process_files(file_list: List[str]) -> Iterator[pa.RecordBatch]:
+            # Both lists follow metadata order, so no reorder is needed after renaming
             source_cols = [m["SourceColumnName"] for m in metadata]
-            missing = set(source_cols) - set(df.columns)
-            if missing:
-                raise ValueError(f"Missing columns in source file: {missing}")
-
-            # Select only the source columns
-            df = df[source_cols]
-
-            # Rename to target column names
-            rename_map = {m["SourceColumnName"]: m["TargetColumnName"] for m in metadata}
-            df = df.rename(columns=rename_map)
-
-            # Reorder to match metadata
             target_cols = [m["TargetColumnName"] for m in metadata]
-            df = df[target_cols]
 
-            return df
+            seen_cols = set()
+            for batch in _iter_source_chunks(file_list, source_type):
+                names = set(batch.schema.names)
+                seen_cols.update(names)
+
+                # Select the source columns (nulls where this file lacks one) under
+                # their target names; existing columns are reused, not copied
+                yield pa.RecordBatch.from_arrays(
+                    [batch.column(col) if col in names else pa.nulls(batch.num_rows, pa.string())
+                     for col in source_cols],
+                    names=target_cols,
+                )
+
+            # Ensure all expected source columns exist in at least one file
+            missing = set(source_cols) - seen_cols
+            if missing:
+                raise ValueError(f"Missing columns in source file: {missing}")
 
         if load_type == "full":
+            # TRUNCATE and load share one connection/transaction; a failed load restores the table
             with engine.begin() as conn:
-                conn.execute(text(f"TRUNCATE TABLE [{target_schema}].[{target_table}]"))
-
-            df = process_files(files)
-            _insert_raw(engine, df, target_schema, target_table)
+                conn.exec_driver_sql(f"TRUNCATE TABLE [{target_schema}].[{target_table}]")
+                rows = _bulk_insert_raw(engine, process_files(files), target_schema, target_table,
+                                        conn=conn)
 
-            result = {"status": "success", "rows": len(df),
-                      "message": f"Full load completed: {len(df)} rows"}
+            result = {"status": "success", "rows": rows,
+                      "message": f"Full load completed: {rows} rows"}
 
         elif load_type == "incremental":
-            last_load_time = _get_incremental_tracker(engine, job_name, stage="source_raw") or datetime(1900, 1, 1)
-
-            new_files = []
-            for f in files:
-                match = DATE_PATTERN.search(os.path.basename(f))
-                if match:
-                    year, month, day = map(int, match.groups())
-                    file_date = datetime(year, month, day)
-                    if file_date > last_load_time:
-                        new_files.append((f, file_date))
-
-            if not new_files:
+            last_load_time = _tracker_value(engine, job_name, "source_raw", trackers) or datetime(1900, 1, 1)
+
+            # One regex pass over the basenames, then a single vectorized date compare
+            dated = [(f, m) for f in files
+                     if (m := DATE_PATTERN.search(os.path.basename(f)))]
+            paths = np.array([f for f, _ in dated], dtype=object)
+            dates = np.array(["-".join(m.groups()) for _, m in dated], dtype="datetime64[D]")
+            mask = dates > np.datetime64(last_load_time, "D")
+
+            if not mask.any():
                 result = {"status": "success", "rows": 0,
                           "message": "No new files to process"}
             else:
-                new_files.sort(key=lambda x: x[1])
-                file_paths = [f for f, _ in new_files]
+                order = np.argsort(dates[mask], kind="stable")
+                file_paths = paths[mask][order].tolist()
 
-                df = process_files(file_paths)
-                _insert_raw(engine, df, target_schema, target_table)
+                max_date = dates[mask].max().astype("datetime64[s]").astype(datetime)
 
-                max_date = max(d for _, d in new_files)
-                _update_incremental_tracker(engine, job_name, max_date, stage="source_raw")
+                # rows and tracker commit together
+                with engine.begin() as conn:
+                    rows = _insert_raw(engine, process_files(file_paths), target_schema, target_table,
+                                       conn=conn)
+                    _update_incremental_tracker(engine, job_name, max_date, stage="source_raw",
+                                                conn=conn)
 
-                result = {"status": "success", "rows": len(df),
-                          "message": f"Incremental load completed: {len(df)} rows"}
+                result = {"status": "success", "rows": rows,
+                          "message": f"Incremental load completed: {rows} rows"}
 
         else:
             msg = f"Unsupported LoadType: {load_type}"
@@ -161,12 +306,12 @@ def load_source_to_raw(engine: Engine, job_name: str) -> Dict[str, Any]:
 
         log_job_end(engine, job_name, stage="source_to_raw",
                     row_count=result.get("rows", 0),
-                    status=result.get("status"), message=result.get("message"))
+                    status=result.get("status"), message=result.get("message"), audit_id=audit_id)
         send_log("raw_curated", result.get("message"), status=result.get("status"))
         return result
 
     except Exception as exc:
         log_job_end(engine, job_name, stage="source_to_raw",
-                    row_count=0, status="failed", message=str(exc))
+                    row_count=0, status="failed", message=str(exc), audit_id=audit_id)
         send_log("raw_curated", str(exc), status="failed", exception=exc)
         return {"status": "error", "message": str(exc)}
@@ -2,8 +2,12 @@
 Validation utilities for Config and Metadata Excel files.
 Ensures required columns exist and values are within allowed ranges.
 """
-from typing import Dict, List, Any
+from typing import Dict, List, Any, FrozenSet, Tuple
 from typing import List
+from functools import lru_cache
+import re
+import time
+import numpy as np
 import pandas as pd
 from sqlalchemy.engine import Engine
 from sqlalchemy import text
@@ -28,6 +32,54 @@ ALLOWED_SQL_TYPES = {
     "DATETIME", "DATE", "NVARCHAR", "VARCHAR"
 }
 
+# --- Upload filename rules (e.g. Config_YYYY_MM_DD.xlsx) ---
+# Compiled once at import; this module is not re-executed by Streamlit reruns
+FILENAME_PATTERNS = {
+    prefix: re.compile(rf"^{prefix}_[0-9]{{4}}_[0-9]{{2}}_[0-9]{{1,2}}\.xlsx$", re.IGNORECASE)
+    for prefix in ("Config", "Metadata")
+}
+
+# Seconds a fetched sys.tables catalog is reused before re-querying; run_job and
+# create_target_tables also clear it, so a cached catalog never outlives a job run
+TABLE_CACHE_TTL = 300
+
+@lru_cache(maxsize=128)
+def valid_filename(filename: str, prefix: str) -> bool:
+    """Check if filename matches required pattern e.g. Config_YYYY_MM_DD.xlsx"""
+    pattern = FILENAME_PATTERNS.get(prefix)
+    if pattern is None:
+        pattern = re.compile(rf"^{prefix}_[0-9]{{4}}_[0-9]{{2}}_[0-9]{{1,2}}\.xlsx$", re.IGNORECASE)
+    return pattern.match(filename) is not None
+
+def _column(df: pd.DataFrame, name: str) -> pd.Series:
+    """df[name] as an object Series, or all None when the column is missing (like row.get)."""
+    if name in df.columns:
+        return df[name].astype(object)
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+def _truthy(s: pd.Series) -> pd.Series:
+    """Element-wise Python truthiness (None/""/0 are falsy, NaN is truthy), as `if value:` saw it."""
+    return s.astype(bool)
+
+def _text(s: pd.Series) -> pd.Series:
+    """str(value or "") for every element (NaN becomes "nan", as str() renders it)."""
+    text_values = pd.Series(s.to_numpy(dtype=object).astype(str), index=s.index)
+    return text_values.where(_truthy(s), "")
+
+def _row_errors(df: pd.DataFrame, checks: List[Tuple[pd.Series, Any]]) -> List[str]:
+    """
+    Collect messages for (mask, message_fn) checks, ordered row by row and then
+    check by check, as the former per-row loop reported them.
+    message_fn(idx, position) builds the message for one failing row.
+    """
+    hits = [
+        (pos, order, fn)
+        for order, (mask, fn) in enumerate(checks)
+        for pos in mask.to_numpy(dtype=bool).nonzero()[0]
+    ]
+    hits.sort(key=lambda h: (h[0], h[1]))
+    return [fn(df.index[pos], pos) for pos, _, fn in hits]
+
 def validate_config_df(df: pd.DataFrame) -> List[str]:
     """validate Config Excel DataFrame. Returns list of error messages."""
     errors: List[str] = []
@@ -37,28 +89,30 @@ def validate_config_df(df: pd.DataFrame) -> List[str]:
     if missing:
         errors.append(f"Missing required columns in Config: {missing}")
 
-    # Row-level checks
-    for idx, row in df.iterrows():
-        job = row.get("JobName")
-        stype = str(row.get("SourceType") or "").lower()
-        ltype = str(row.get("LoadType") or "").lower()
-        scd = str(row.get("SCDType") or "").lower() if row.get("SCDType") else None
-        tgt_schema = row.get("TargetSchema")
-        tgt_table = row.get("TargetTable")
-        spath = row.get("SourcePath")
-
-        if not job:
-            errors.append(f"Row {idx}: JobName is required.")
-        if stype and stype not in ALLOWED_SOURCE_TYPES:
-            errors.append(f"Row {idx} ({job}): SourceType must be csv or json or table.")
-        if ltype not in ALLOWED_LOAD_TYPES:
-            errors.append(f"Row {idx} ({job}): LoadType must be full or incremental.")
-        if scd not in ALLOWED_SCD_TYPES:
-            errors.append(f"Row {idx} ({job}): SCDType must be 1, 2, or NULL.")
-        if not tgt_schema or not tgt_table:
-            errors.append(f"Row {idx} ({job}): TargetSchema and TargetTable are required.")
-        if stype in ALLOWED_SOURCE_TYPES and not spath:
-            errors.append(f"Row {idx} ({job}): SourcePath is required for file sources.")
+    # Row-level checks, one vectorized mask per rule
+    job = _column(df, "JobName").to_numpy()
+    stype = _text(_column(df, "SourceType")).str.lower()
+    ltype = _text(_column(df, "LoadType")).str.lower()
+    scd = _text(_column(df, "SCDType")).str.lower()
+    has_target = _truthy(_column(df, "TargetSchema")) & _truthy(_column(df, "TargetTable"))
+    has_path = _truthy(_column(df, "SourcePath"))
+
+    checks = [
+        (~_truthy(_column(df, "JobName")),
+         lambda idx, pos: f"Row {idx}: JobName is required."),
+        (stype.ne("") & ~stype.isin(ALLOWED_SOURCE_TYPES),
+         lambda idx, pos: f"Row {idx} ({job[pos]}): SourceType must be csv or json or table."),
+        (~ltype.isin(ALLOWED_LOAD_TYPES),
+         lambda idx, pos: f"Row {idx} ({job[pos]}): LoadType must be full or incremental."),
+        # Empty SCDType is the allowed NULL
+        (scd.ne("") & ~scd.isin(ALLOWED_SCD_TYPES - {None}),
+         lambda idx, pos: f"Row {idx} ({job[pos]}): SCDType must be 1, 2, or NULL."),
+        (~has_target,
+         lambda idx, pos: f"Row {idx} ({job[pos]}): TargetSchema and TargetTable are required."),
+        (stype.isin(ALLOWED_SOURCE_TYPES) & ~has_path,
+         lambda idx, pos: f"Row {idx} ({job[pos]}): SourcePath is required for file sources."),
+    ]
+    errors.extend(_row_errors(df, checks))
 
     return errors
 
@@ -71,38 +125,49 @@ def validate_metadata_df(df: pd.DataFrame) -> List[str]:
     if missing:
         errors.append(f"Missing required columns in Metadata: {missing}")
 
-    # Row-level checks
-    for idx, row in df.iterrows():
-        job = row.get("JobName")
-        dtype = str(row.get("TargetDataType") or "").upper()
-        length = row.get("Length")
-
-        base_type = dtype.split("(")[0]
-        if base_type not in ALLOWED_SQL_TYPES:
-            errors.append(f"Row {idx} ({job}): TargetDataType '{dtype}' not allowed.")
-
-        if pd.isna(length) or int(length) < 0:
-            errors.append(f"Row {idx} ({job}): Length must be a non-negative integer.")
-
-        if base_type in {"NVARCHAR", "VARCHAR"} and (pd.isna(length) or int(length) == 0):
-            errors.append(f"Row {idx} ({job}): NVARCHAR/VARCHAR require positive Length.")
+    # Row-level checks, one vectorized mask per rule
+    job = _column(df, "JobName").to_numpy()
+    dtype = _text(_column(df, "TargetDataType")).str.upper()
+    base_type = dtype.str.split("(", n=1).str[0]
+    length = np.trunc(pd.to_numeric(_column(df, "Length"), errors="coerce"))
+    dtype_values = dtype.to_numpy()
+
+    checks = [
+        (~base_type.isin(ALLOWED_SQL_TYPES),
+         lambda idx, pos: f"Row {idx} ({job[pos]}): TargetDataType '{dtype_values[pos]}' not allowed."),
+        (length.isna() | length.lt(0),
+         lambda idx, pos: f"Row {idx} ({job[pos]}): Length must be a non-negative integer."),
+        (base_type.isin({"NVARCHAR", "VARCHAR"}) & (length.isna() | length.eq(0)),
+         lambda idx, pos: f"Row {idx} ({job[pos]}): NVARCHAR/VARCHAR require positive Length."),
+    ]
+    errors.extend(_row_errors(df, checks))
 
     return errors
 
-# validate table exists
-def _table_exists(engine: Engine, schema: str, table: str) -> bool:
+# --- Catalog of existing tables, cached for TABLE_CACHE_TTL seconds ---
+@lru_cache(maxsize=1)
+def _fetch_existing_tables(engine: Engine, ttl_bucket: int) -> FrozenSet[Tuple[str, str]]:
     with engine.connect() as conn:
-        result = conn.execute(
+        rows = conn.execute(
             text("""
-                SELECT 1
+                SELECT LOWER(s.name), LOWER(t.name)
                 FROM sys.tables t
                 JOIN sys.schemas s ON t.schema_id = s.schema_id
-                WHERE LOWER(s.name) = LOWER(:schema)
-                  AND LOWER(t.name) = LOWER(:table)
-            """),
-            {"schema": schema, "table": table}
-        ).scalar()
-    return result is not None
+            """)
+        ).all()
+    return frozenset((schema, table) for schema, table in rows)
+
+def _existing_tables(engine: Engine) -> FrozenSet[Tuple[str, str]]:
+    """Return all (schema, table) pairs in the database, lower-cased."""
+    return _fetch_existing_tables(engine, int(time.monotonic() // TABLE_CACHE_TTL))
+
+def _clear_table_cache() -> None:
+    """Drop the cached catalog, e.g. at the start of a job run or after a CREATE TABLE."""
+    _fetch_existing_tables.cache_clear()
+
+# validate table exists
+def _table_exists(engine: Engine, schema: str, table: str) -> bool:
+    return (schema.lower(), table.lower()) in _existing_tables(engine)
 
 
 # --- Fetch config ---
@@ -1,16 +1,23 @@
 import io
 import sys
 import os
-import re
 import pandas as pd
 import streamlit as st
 from sqlalchemy import text
 from scripts.db_connection import get_engine
-from scripts.validate_input import validate_config_df, validate_metadata_df
+from scripts.validate_input import validate_config_df, validate_metadata_df, valid_filename
 from scripts.load_config_metadata import load_config_df, load_metadata_df
 from scripts.orchestration import run_job
 from scripts.scd_type import scd1_merge, scd2_merge
 
+# python-calamine (Rust) parses uploads much faster than pandas' default openpyxl;
+# fall back to openpyxl where it is not installed
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
@@ -32,23 +39,84 @@ with st.expander("📖 How to use this app", expanded=True):
 # --- Directories ---
 CONFIG_DIR = r"C:\Users\ANayak4\OneDrive - Rockwell Automation, Inc\Desktop\ETL Job Runner\input_files\config"
 METADATA_DIR = r"C:\Users\ANayak4\OneDrive - Rockwell Automation, Inc\Desktop\ETL Job Runner\input_files\metadata"
+LINEAGE_PAGE_SIZE = 50
 os.makedirs(CONFIG_DIR, exist_ok=True)
 os.makedirs(METADATA_DIR, exist_ok=True)
 
-engine = get_engine()
+# Engine (and its connection pool) survives Streamlit reruns
+@st.cache_resource
+def _cached_engine():
+    return get_engine()
+
+engine = _cached_engine()
 
 # --- Helpers ---
-def job_exists(engine, job: str) -> bool:
+# Config lookups are cached across reruns; cleared after a Config/Metadata load.
+# The leading underscore keeps Streamlit from hashing the engine argument.
+@st.cache_data(ttl=60, show_spinner=False)
+def job_exists(_engine, job: str) -> bool:
     if not job:
         return False
-    with engine.connect() as conn:
+    with _engine.connect() as conn:
         res = conn.execute(text("SELECT 1 FROM Config WHERE JobName = :job"), {"job": job})
         return res.first() is not None
 
-def valid_filename(filename: str, prefix: str) -> bool:
-    """Check if filename matches required pattern e.g. Config_YYYY_MM_DD.xlsx"""
-    pattern = rf"^{prefix}_[0-9]{{4}}_[0-9]{{2}}_[0-9]{{1,2}}\.xlsx$"
-    return re.match(pattern, filename, re.IGNORECASE) is not None
+@st.cache_data(ttl=60, show_spinner=False)
+def job_target_schema(_engine, job: str):
+    with _engine.connect() as conn:
+        row = conn.execute(
+            text("SELECT TargetSchema FROM Config WHERE JobName = :job"),
+            {"job": job}
+        ).mappings().first()
+    return row["TargetSchema"] if row else None
+
+@st.cache_data(ttl=60, show_spinner=False)
+def lineage_table(_engine, family_prefix: str, schema: str):
+    """
+    (TargetTable, TargetColumnNames, PK column names) for the job family's table
+    in schema, or None. Columns follow the table's column order.
+    """
+    with _engine.connect() as conn:
+        config_row = conn.execute(
+            text("SELECT JobName, TargetTable FROM Config WHERE JobName LIKE :prefix AND TargetSchema = :schema"),
+            {"prefix": f"{family_prefix}%", "schema": schema}
+        ).mappings().first()
+        if not config_row:
+            return None
+        # Metadata has no ordinal of its own; the target table's column order is stable
+        rows = conn.execute(
+            text("""
+                SELECT m.TargetColumnName, m.IsPK
+                FROM Metadata m
+                LEFT JOIN INFORMATION_SCHEMA.COLUMNS c
+                  ON c.TABLE_SCHEMA = :schema AND c.TABLE_NAME = :table
+                 AND c.COLUMN_NAME = m.TargetColumnName COLLATE DATABASE_DEFAULT
+                WHERE m.JobName = :job
+                ORDER BY c.ORDINAL_POSITION, m.TargetColumnName
+            """),
+            {"job": config_row["JobName"], "schema": schema, "table": config_row["TargetTable"]}
+        ).mappings().all()
+    columns = [r["TargetColumnName"] for r in rows]
+    pk_columns = [r["TargetColumnName"] for r in rows if r["IsPK"]]
+    return config_row["TargetTable"], columns, pk_columns
+
+@st.cache_data(ttl=30, show_spinner=False)
+def lineage_page(_engine, schema: str, table: str, columns: tuple, pk_columns: tuple,
+                 page_size: int, page: int) -> pd.DataFrame:
+    """
+    One page of the selected columns, fetched server-side with OFFSET/FETCH.
+    Ordered by the PK, then the other selected columns, so pages neither overlap nor skip rows.
+    """
+    col_clause = ", ".join(f"[{c}]" for c in columns)
+    order_cols = list(pk_columns) + [c for c in columns if c not in pk_columns]
+    order_clause = ", ".join(f"[{c}]" for c in order_cols)
+    query = text(
+        f"SELECT {col_clause} FROM [{schema}].[{table}] "
+        f"ORDER BY {order_clause} OFFSET :offset ROWS FETCH NEXT :size ROWS ONLY"
+    )
+    with _engine.connect() as conn:
+        result = conn.execute(query, {"offset": (page - 1) * page_size, "size": page_size})
+        return pd.DataFrame.from_records(result.tuples(), columns=list(columns))
 
 # --- Job Name ---
 job_name = st.text_input("🔑 Enter Job Name", placeholder="Eg. JOB_EMP_RAW")
@@ -117,7 +185,7 @@ with tab1:
                 f.write(config_file.getbuffer())
             st.info(f"📂 Config file saved to {config_path}")
 
-            df = pd.read_excel(io.BytesIO(config_file.getvalue()))
+            df = pd.read_excel(io.BytesIO(config_file.getvalue()), engine=EXCEL_ENGINE)
             errors = validate_config_df(df)
             if errors:
                 st.error("⚠️ Config validation failed:")
@@ -127,6 +195,7 @@ with tab1:
             result = load_config_df(engine, df)
             if result["status"] == "success":
                 inserted = result.get("inserted", 0)
+                st.cache_data.clear()  # new jobs must be visible to job_exists / lineage
                 st.success(f"✅ Config loaded: {inserted} rows")
             else:
                 st.error(f"❌ Config load failed: {result['message']}")
@@ -142,7 +211,7 @@ with tab1:
                 f.write(metadata_file.getbuffer())
             st.info(f"📂 Metadata file saved to {metadata_path}")
 
-            df = pd.read_excel(io.BytesIO(metadata_file.getvalue()))
+            df = pd.read_excel(io.BytesIO(metadata_file.getvalue()), engine=EXCEL_ENGINE)
             errors = validate_metadata_df(df)
             if errors:
                 st.error("⚠️ Metadata validation failed:")
@@ -152,6 +221,7 @@ with tab1:
             result = load_metadata_df(engine, df)
             if result["status"] == "success":
                 inserted = result.get("inserted", 0)
+                st.cache_data.clear()
                 st.success(f"✅ Metadata loaded: {inserted} rows")
             else:
                 st.error(f"❌ Metadata load failed: {result['message']}")
@@ -186,16 +256,11 @@ with tab3:
         st.info("Enter a Job Name above and run it to see lineage.")
     else:
         try:
-            with engine.connect() as conn:
-                row = conn.execute(
-                    text("SELECT TargetSchema FROM Config WHERE JobName = :job"),
-                    {"job": job_name}
-                ).mappings().first()
+            target_schema = job_target_schema(engine, job_name)
 
-            if not row:
+            if not target_schema:
                 st.warning(f"No Config found for job '{job_name}'")
             else:
-                target_schema = row["TargetSchema"]
 
                 # Decide lineage chain
                 if target_schema == "raw":
@@ -207,28 +272,35 @@ with tab3:
                 else:
                     schemas_to_show = [target_schema]
 
+                page_col, size_col = st.columns(2)
+                page_size = int(size_col.number_input("Rows per page", min_value=10, max_value=1000,
+                                                      value=LINEAGE_PAGE_SIZE, step=10))
+                page = int(page_col.number_input("Page", min_value=1, value=1, step=1))
+
                 tabs = st.tabs([s.capitalize() for s in schemas_to_show])
 
                 # Derive job family prefix: e.g. JOB_EMP, JOB_MANAGER
                 family_prefix = "_".join(job_name.split("_")[:2])
 
-                with engine.connect() as conn:
-                    for idx, schema in enumerate(schemas_to_show):
-                        with tabs[idx]:
-                            config_row = conn.execute(
-                                text("SELECT TargetTable FROM Config WHERE JobName LIKE :prefix AND TargetSchema = :schema"),
-                                {"prefix": f"{family_prefix}%", "schema": schema}
-                            ).mappings().first()
-
-                            if config_row:
-                                table = config_row["TargetTable"]
-                                st.markdown(f"**{schema}.{table}**")
-                                try:
-                                    df = pd.read_sql(text(f"SELECT TOP 50 * FROM [{schema}].[{table}]"), conn)
-                                    st.dataframe(df, use_container_width=True)
-                                except Exception as exc:
-                                    st.warning(f"No table found: {schema}.{table} ({exc})")
-                            else:
-                                st.warning(f"No table mapping found for schema {schema}")
+                for idx, schema in enumerate(schemas_to_show):
+                    with tabs[idx]:
+                        mapping = lineage_table(engine, family_prefix, schema)
+
+                        if mapping:
+                            table, all_columns, pk_columns = mapping
+                            st.markdown(f"**{schema}.{table}**")
+                            columns = st.multiselect("Columns", all_columns, default=all_columns,
+                                                     key=f"lineage_cols_{schema}")
+                            if not columns:
+                                st.info("Select at least one column to preview.")
+                                continue
+                            try:
+                                df = lineage_page(engine, schema, table, tuple(columns), tuple(pk_columns),
+                                                  page_size, page)
+                                st.dataframe(df, use_container_width=True)
+                            except Exception as exc:
+                                st.warning(f"No table found: {schema}.{table} ({exc})")
+                        else:
+                            st.warning(f"No table mapping found for schema {schema}")
         except Exception as exc:
             st.error(f"💥 Unexpected error while showing lineage: {exc}")